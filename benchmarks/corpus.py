@@ -0,0 +1,63 @@
+"""
+Deterministic synthetic text for the benchmarks.
+
+The same seed always gives the same documents and questions, so runs on
+different machines or commits ingest and ask exactly the same things.
+"""
+
+import random
+from typing import List
+
+SYLLABLES = (
+    "ka", "lo", "mi", "ra", "ten", "sul", "vo", "dri", "an", "pel",
+    "os", "qui", "ber", "na", "tor", "ex", "lin", "ga", "fu", "ser",
+)
+
+
+def vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+class Corpus:
+    """Documents of sentences and paragraphs, and questions about them."""
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self.words = vocabulary(random.Random(seed))
+
+    def sentence(self, rng: random.Random) -> str:
+        words = [rng.choice(self.words) for _ in range(rng.randint(6, 20))]
+        return " ".join(words).capitalize() + "."
+
+    def document(self, size_chars: int, index: int = 0) -> str:
+        """About `size_chars` characters of text in paragraphs of a few sentences."""
+        rng = random.Random(f"{self.seed}:document:{index}")
+        paragraphs, length = [], 0
+        while length < size_chars:
+            paragraph = " ".join(self.sentence(rng) for _ in range(rng.randint(3, 8)))
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs)
+
+    def chunks(self, count: int, size_chars: int = 1000) -> List[str]:
+        """`count` chunk sized texts, as embedding batches see them."""
+        rng = random.Random(f"{self.seed}:chunks")
+        texts = []
+        for _ in range(count):
+            text = ""
+            while len(text) < size_chars:
+                text += self.sentence(rng) + " "
+            texts.append(text[:size_chars])
+        return texts
+
+    def questions(self, count: int) -> List[str]:
+        rng = random.Random(f"{self.seed}:questions")
+        return [
+            "What does the text say about "
+            + " ".join(rng.choice(self.words) for _ in range(rng.randint(2, 5)))
+            + "?"
+            for _ in range(count)
+        ]
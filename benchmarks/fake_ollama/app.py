@@ -0,0 +1,102 @@
+"""
+Stand-in for the Ollama API, so the services can be benchmarked without a model.
+
+/api/generate answers like ollama, streamed as JSON lines or as one object with
+the duration fields and a context, after waiting as a model would:
+FAKE_LOAD_MS the first time, FAKE_PROMPT_MS_PER_TOKEN for every prompt token
+(4 characters each) and FAKE_TOKEN_MS for each of the FAKE_ANSWER_TOKENS
+generated tokens (or options.num_predict). A context sent back with the request
+is not evaluated again, like ollama's KV cache. At most FAKE_PARALLEL
+generations run at once, the rest wait, as with OLLAMA_NUM_PARALLEL.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+FAKE_LOAD_MS = float(os.getenv("FAKE_LOAD_MS", "2000"))
+FAKE_PROMPT_MS_PER_TOKEN = float(os.getenv("FAKE_PROMPT_MS_PER_TOKEN", "0.5"))
+FAKE_TOKEN_MS = float(os.getenv("FAKE_TOKEN_MS", "20"))
+FAKE_ANSWER_TOKENS = int(os.getenv("FAKE_ANSWER_TOKENS", "64"))
+FAKE_PARALLEL = int(os.getenv("FAKE_PARALLEL", "1"))
+
+WORDS = ("the", " document", " says", " that", " it", " depends", " on", " context", ".")
+
+app = FastAPI(title="Fake Ollama")
+slots = asyncio.Semaphore(FAKE_PARALLEL)
+loaded = set()
+
+
+class GenerateRequest(BaseModel):
+    model: str
+    prompt: str = ""
+    stream: bool = True
+    context: list = []
+    options: dict = {}
+    keep_alive: object = None
+
+
+@app.get("/")
+def root():
+    return "Ollama is running"
+
+
+@app.get("/api/version")
+def version():
+    return {"version": "0.0.0-fake"}
+
+
+@app.post("/api/generate")
+async def generate(request: GenerateRequest):
+    answer_tokens = int(request.options.get("num_predict", FAKE_ANSWER_TOKENS))
+    if request.stream:
+        return StreamingResponse(
+            (json.dumps(chunk) + "\n" async for chunk in run(request, answer_tokens)),
+            media_type="application/x-ndjson",
+        )
+    text, final = "", None
+    async for chunk in run(request, answer_tokens):
+        text += chunk["response"]
+        final = chunk
+    return {**final, "response": text}
+
+
+async def run(request: GenerateRequest, answer_tokens: int):
+    started = time.perf_counter()
+    async with slots:
+        load = 0.0
+        if request.model not in loaded:
+            load = FAKE_LOAD_MS / 1000
+            await asyncio.sleep(load)
+            loaded.add(request.model)
+        prompt_tokens = (len(request.prompt) + 3) // 4
+        prompt_eval = prompt_tokens * FAKE_PROMPT_MS_PER_TOKEN / 1000
+        await asyncio.sleep(prompt_eval)
+        eval_started = time.perf_counter()
+        for index in range(answer_tokens):
+            await asyncio.sleep(FAKE_TOKEN_MS / 1000)
+            yield {
+                "model": request.model,
+                "response": WORDS[index % len(WORDS)],
+                "done": False,
+            }
+        evaluation = time.perf_counter() - eval_started
+    context = list(request.context) + list(range(prompt_tokens + answer_tokens))
+    yield {
+        "model": request.model,
+        "response": "",
+        "done": True,
+        "context": context,
+        # ollama reports nanoseconds
+        "total_duration": int((time.perf_counter() - started) * 1e9),
+        "load_duration": int(load * 1e9),
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int(prompt_eval * 1e9),
+        "eval_count": answer_tokens,
+        "eval_duration": int(evaluation * 1e9),
+    }
@@ -0,0 +1,386 @@
+"""
+End-to-end load tests against a running stack (see docker-compose.bench.yaml).
+
+Scenarios:
+  ask       concurrent questions to the orchestrator's /ask about an uploaded
+            synthetic document; --stream uses /ask_stream and also reports the
+            time to the first token
+  upload    bulk ingestion through the orchestrator's /upload, --files-per-request
+            files per request (fanned out by UPLOAD_CONCURRENCY), synchronously
+            or as background jobs followed to the end
+  retrieve  retrieval-only load on the retrieval service's /retrieve_document,
+            over collections of increasing size
+
+Every scenario runs once per --concurrency level, each giving one result.
+Documents and questions come from a seeded generator (corpus.py), so runs are
+comparable across machines and commits. The report is printed and saved to
+--out; with --baseline it is compared to a saved report, and
+--fail-on-regression exits with status 1 when a result got slower.
+
+  python benchmarks/loadtest.py ask --concurrency 1,4,16 --requests 200
+  python benchmarks/loadtest.py retrieve --corpus-sizes 100,1000,10000
+  python benchmarks/loadtest.py upload --files 20 --background
+  python benchmarks/loadtest.py upload --files 20 --files-per-request 4 --concurrency 1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+import report
+from corpus import Corpus
+
+logger = logging.getLogger("loadtest")
+
+# characters between the starts of two chunks (chunk size 1000, overlap 200)
+CHUNK_STRIDE = 800
+
+
+class RequestFailed(Exception):
+    pass
+
+
+async def run_load(
+    send: Callable[[int], Awaitable[Optional[float]]], requests: int, concurrency: int
+):
+    """Call `send(index)` for every index from `concurrency` concurrent workers.
+
+    `send` returns the seconds to the first token for streams, None otherwise;
+    an exception counts as an error. Returns (latencies, ttfts, errors, duration).
+    """
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                ttft = await send(index)
+            except Exception as e:
+                errors += 1
+                logger.warning("Request %d failed: %s", index, e)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, ttfts, errors, time.perf_counter() - started
+
+
+def check(response: httpx.Response) -> dict:
+    """The JSON body of a successful response; the services report some errors in it."""
+    if response.status_code != 200:
+        raise RequestFailed(f"HTTP {response.status_code}: {response.text[:200]}")
+    body = response.json()
+    if isinstance(body, dict) and body.get("error"):
+        raise RequestFailed(body["error"])
+    return body
+
+
+async def upload(client: httpx.AsyncClient, name: str, text: str, background: bool = False):
+    """Upload one file through the orchestrator and return its per-file result."""
+    return (await upload_files(client, {name: text}, background))[0]
+
+
+async def upload_files(
+    client: httpx.AsyncClient, texts: Dict[str, str], background: bool = False
+) -> List[dict]:
+    """Upload files in one /upload request and return their per-file results."""
+    response = await client.post(
+        "/upload",
+        params={"background": background},
+        files=[
+            ("files", (name, text.encode("utf-8"), "text/plain"))
+            for name, text in texts.items()
+        ],
+    )
+    results = check(response)["files"]
+    for result in results:
+        if result["status"] == "error":
+            raise RequestFailed(result["error"])
+    return results
+
+
+async def wait_for_job(client: httpx.AsyncClient, job_id: str, interval: float = 0.2) -> dict:
+    while True:
+        job = check(await client.get(f"/jobs/{job_id}"))
+        if job["status"] == "completed":
+            return job
+        if job["status"] == "failed":
+            raise RequestFailed(job.get("error") or "ingestion job failed")
+        await asyncio.sleep(interval)
+
+
+async def ask_scenario(args, corpus: Corpus, results: report.Report) -> None:
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limits(args)
+    ) as client:
+        collection = f"bench-ask-{args.seed}.txt"
+        logger.info("Uploading %s (%d KB)", collection, args.doc_kb)
+        await upload(client, collection, corpus.document(args.doc_kb * 1024))
+
+        per_level = args.warmup + args.requests
+        questions = corpus.questions(per_level * len(args.concurrency))
+        # a fraction of the questions repeat a few popular ones, as real traffic does
+        rng = random.Random(f"{args.seed}:repeats")
+        hot = questions[:10]
+        for level, concurrency in enumerate(args.concurrency):
+            # each level asks new questions, or it would be answered from the cache
+            asked = [
+                rng.choice(hot) if rng.random() < args.repeat_ratio else question
+                for question in questions[level * per_level : (level + 1) * per_level]
+            ]
+            flags = {"cached": 0, "coalesced": 0}
+
+            async def send(index: int, offset: int = 0) -> Optional[float]:
+                question = asked[offset + index]
+                payload = {"conversation_id": collection, "question": question}
+                if not args.stream:
+                    body = check(await client.post(f"/ask/{collection}", json=payload))
+                    for flag in flags:
+                        flags[flag] += bool(body.get(flag))
+                    return None
+                started, ttft = time.perf_counter(), None
+                async with client.stream("POST", f"/ask_stream/{collection}", json=payload) as response:
+                    if response.status_code != 200:
+                        raise RequestFailed(f"HTTP {response.status_code}")
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[len("data: ") :])
+                        if event.get("error"):
+                            raise RequestFailed(event["error"])
+                        if event.get("token") and ttft is None:
+                            ttft = time.perf_counter() - started
+                        if event.get("done"):
+                            for flag in flags:
+                                flags[flag] += bool(event.get(flag))
+                return ttft
+
+            await run_load(send, args.warmup, min(concurrency, max(args.warmup, 1)))
+            flags.update(cached=0, coalesced=0)
+            latencies, ttfts, errors, duration = await run_load(
+                lambda index: send(index, args.warmup), args.requests, concurrency
+            )
+            done = max(len(latencies), 1)
+            results.results.append(
+                report.summarize(
+                    "ask",
+                    {
+                        "concurrency": concurrency,
+                        "stream": args.stream,
+                        "repeat_ratio": args.repeat_ratio,
+                    },
+                    latencies,
+                    errors,
+                    duration,
+                    ttft=ttfts,
+                    extra={
+                        "cached_ratio": flags["cached"] / done,
+                        "coalesced_ratio": flags["coalesced"] / done,
+                    },
+                )
+            )
+
+
+async def upload_scenario(args, corpus: Corpus, results: report.Report) -> None:
+    run = int(time.time())
+    size = args.file_kb * 1024
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limits(args)
+    ) as client:
+        for concurrency in args.concurrency:
+            # fresh names every run, re-uploading a collection skips its unchanged chunks
+            names = [f"bench-upload-{run}-{concurrency}-{i}.txt" for i in range(args.files)]
+            per_request = args.files_per_request
+            chunks, uploaded = 0, 0
+
+            async def send(index: int) -> None:
+                nonlocal chunks, uploaded
+                batch = range(index * per_request, min((index + 1) * per_request, args.files))
+                texts = {names[i]: corpus.document(size, i) for i in batch}
+                for result in await upload_files(client, texts, args.background):
+                    if args.background:
+                        job = await wait_for_job(client, result["job_id"])
+                        chunks += job["chunks_done"]
+                    else:
+                        chunks += (result["added"] or 0) + (result["skipped"] or 0)
+                uploaded += len(texts)
+
+            requests = -(-args.files // per_request)
+            latencies, _, errors, duration = await run_load(send, requests, concurrency)
+            results.results.append(
+                report.summarize(
+                    "upload",
+                    {
+                        "concurrency": concurrency,
+                        "file_kb": args.file_kb,
+                        "files_per_request": per_request,
+                        "background": args.background,
+                    },
+                    latencies,
+                    errors,
+                    duration,
+                    extra={
+                        "chunks_per_s": chunks / duration if duration else 0,
+                        "mb_per_s": uploaded * size / 1e6 / duration if duration else 0,
+                    },
+                )
+            )
+            if not args.keep:
+                await delete_collections(args, names)
+
+
+async def delete_collections(args, names: List[str]) -> None:
+    async with httpx.AsyncClient(base_url=args.retrival_url, timeout=args.timeout) as client:
+        for name in names:
+            try:
+                await client.delete(f"/collections/{name}")
+            except httpx.HTTPError as e:
+                logger.warning("Error deleting %s: %s", name, e)
+
+
+async def retrieve_scenario(args, corpus: Corpus, results: report.Report) -> None:
+    async with httpx.AsyncClient(
+        base_url=args.retrival_url, timeout=args.timeout, limits=limits(args)
+    ) as client:
+        for size in args.corpus_sizes:
+            collection = f"bench-retrieve-{args.seed}-{size}"
+            started = time.perf_counter()
+            # saving is incremental, an already ingested corpus is only compared
+            saved = check(
+                await client.post(
+                    "/save_document",
+                    json={
+                        "collection_id": collection,
+                        "document_text": corpus.document(size * CHUNK_STRIDE, size),
+                    },
+                )
+            )
+            chunks = saved["added"] + saved["skipped"]
+            logger.info(
+                "Collection %s: %d chunks (%d embedded) in %.1fs",
+                collection,
+                chunks,
+                saved["added"],
+                time.perf_counter() - started,
+            )
+            questions = corpus.questions(args.warmup + args.requests)
+
+            async def send(index: int, offset: int = 0) -> None:
+                check(
+                    await client.post(
+                        "/retrieve_document",
+                        json={
+                            "collection_id": collection,
+                            "query": questions[offset + index],
+                            "k": args.k,
+                            "mode": args.mode,
+                        },
+                    )
+                )
+
+            for concurrency in args.concurrency:
+                await run_load(send, args.warmup, min(concurrency, max(args.warmup, 1)))
+                latencies, _, errors, duration = await run_load(
+                    lambda index: send(index, args.warmup), args.requests, concurrency
+                )
+                results.results.append(
+                    report.summarize(
+                        "retrieve",
+                        {
+                            "corpus_size": size,
+                            "concurrency": concurrency,
+                            "k": args.k,
+                            "mode": args.mode,
+                        },
+                        latencies,
+                        errors,
+                        duration,
+                        extra={"chunks": chunks},
+                    )
+                )
+
+
+SCENARIOS = {"ask": ask_scenario, "upload": upload_scenario, "retrieve": retrieve_scenario}
+
+
+def limits(args) -> httpx.Limits:
+    most = max(args.concurrency)
+    return httpx.Limits(max_connections=most, max_keepalive_connections=most)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--url", default="http://localhost:9000", help="orchestrator")
+    parser.add_argument("--retrival-url", default="http://localhost:7000")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="measured, per level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured, per level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600)
+    # ask
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--doc-kb", type=int, default=64)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0)
+    # upload
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--files-per-request", type=int, default=1)
+    parser.add_argument("--background", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="keep uploaded collections")
+    # retrieve
+    parser.add_argument("--corpus-sizes", type=int_list, default=[100, 1000, 10000])
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--mode", default="auto")
+    # reporting
+    parser.add_argument("--out", help="report path (default benchmarks/results/...)")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def finish(args, results: report.Report, default_name: str) -> int:
+    """Print and save a report, compare it with the baseline; the exit status."""
+    print(report.format_table(results))
+    out = args.out or f"benchmarks/results/{default_name}-{int(results.created_at)}.json"
+    report.save(results, out)
+    print(f"\nSaved {out}")
+    if not args.baseline:
+        return 0
+    lines, regressed = report.compare(results, report.load(args.baseline), args.threshold)
+    print(f"\nCompared with {args.baseline} (threshold {args.threshold:.0%})")
+    print("\n".join(lines))
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    args = parse_args(argv)
+    results = report.new_report()
+    asyncio.run(SCENARIOS[args.scenario](args, Corpus(args.seed), results))
+    return finish(args, results, args.scenario)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Microbenchmarks of the retrieval service's CPU-bound steps, without the stack.
+
+  chunking  text_to_documents (services/retrival/chunking.py) on documents of
+            --doc-kb sizes
+  embed     the embedding model on --chunks chunk sized texts, called with
+            --batch-sizes texts at a time (INGEST_EMBED_BATCH_SIZE,
+            EMBED_WORKER_BATCH_SIZE and EMBED_MAX_BATCH_SIZE pick these)
+
+The model is loaded like the service loads it (--model, BAAI/bge-small-en-v1.5 by
+default); set HF_HUB_OFFLINE=1 to use the local cache only. Reporting and
+baseline comparison work as in loadtest.py.
+
+  python benchmarks/micro.py chunking --doc-kb 16,256,4096
+  python benchmarks/micro.py embed --batch-sizes 1,8,32,64,128 --baseline old.json
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import report
+from corpus import Corpus
+from loadtest import finish, int_list
+
+RETRIVAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "retrival")
+
+
+def chunking(args, corpus: Corpus, results: report.Report) -> None:
+    sys.path.insert(0, RETRIVAL_DIR)
+    from chunking import text_to_documents
+
+    for size in args.doc_kb:
+        text = corpus.document(size * 1024, size)
+        text_to_documents(text, {"file": "warmup"})
+        latencies, chunks = [], 0
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            call = time.perf_counter()
+            chunks = len(text_to_documents(text, {"file": "bench"}))
+            latencies.append(time.perf_counter() - call)
+        duration = time.perf_counter() - started
+        results.results.append(
+            report.summarize(
+                "chunking",
+                {"doc_kb": size},
+                latencies,
+                0,
+                duration,
+                extra={
+                    "chunks": chunks,
+                    "mb_per_s": len(text) * args.repeat / 1e6 / duration,
+                },
+            )
+        )
+
+
+def embed(args, corpus: Corpus, results: report.Report) -> None:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    texts = corpus.chunks(args.chunks)
+    for batch_size in args.batch_sizes:
+        # the model batches internally too, let it take each call whole
+        model = HuggingFaceEmbeddings(
+            model_name=args.model,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"normalize_embeddings": True, "batch_size": batch_size},
+        )
+        model.embed_documents(texts[:batch_size])
+        latencies = []
+        started = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            call = time.perf_counter()
+            model.embed_documents(texts[start : start + batch_size])
+            latencies.append(time.perf_counter() - call)
+        duration = time.perf_counter() - started
+        results.results.append(
+            report.summarize(
+                "embed",
+                {"batch_size": batch_size, "chunks": args.chunks, "model": args.model},
+                latencies,
+                0,
+                duration,
+                extra={"texts_per_s": len(texts) / duration},
+            )
+        )
+
+
+BENCHMARKS = {"chunking": chunking, "embed": embed}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    # chunking
+    parser.add_argument("--doc-kb", type=int_list, default=[16, 256, 4096])
+    parser.add_argument("--repeat", type=int, default=20)
+    # embed
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 8, 16, 32, 64, 128])
+    # reporting
+    parser.add_argument("--out", help="report path (default benchmarks/results/...)")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = report.new_report()
+    BENCHMARKS[args.benchmark](args, Corpus(args.seed), results)
+    return finish(args, results, args.benchmark)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
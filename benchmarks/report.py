@@ -0,0 +1,195 @@
+"""
+Benchmark results: latency percentiles, throughput, JSON reports and baseline
+comparison.
+
+A report is a JSON file with the environment it was measured in and one result
+per scenario and parameter set. Comparing against a saved baseline matches
+results by scenario and parameters, and flags a regression when a latency
+percentile grew, or the throughput dropped, by more than the threshold.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyStats(BaseModel):
+    """Latency distribution, in milliseconds."""
+
+    mean: float = 0
+    p50: float = 0
+    p95: float = 0
+    p99: float = 0
+    max: float = 0
+
+    @classmethod
+    def of(cls, seconds: List[float]) -> "LatencyStats":
+        if not seconds:
+            return cls()
+        ordered = sorted(seconds)
+        stats = {f"p{p}": percentile(ordered, p) * 1000 for p in PERCENTILES}
+        return cls(mean=sum(ordered) / len(ordered) * 1000, max=ordered[-1] * 1000, **stats)
+
+
+class Result(BaseModel):
+    """One scenario run at one set of parameters."""
+
+    scenario: str
+    params: Dict[str, object] = {}
+    requests: int
+    errors: int = 0
+    duration_s: float
+    throughput_rps: float
+    latency_ms: LatencyStats
+    # time to the first streamed token, for streaming scenarios
+    ttft_ms: Optional[LatencyStats] = None
+    # scenario specific figures, e.g. chunks per second
+    extra: Dict[str, float] = {}
+
+    @property
+    def key(self) -> str:
+        params = ",".join(f"{name}={value}" for name, value in sorted(self.params.items()))
+        return f"{self.scenario}[{params}]"
+
+
+class Report(BaseModel):
+    """Results of a benchmark run and where they were measured."""
+
+    created_at: float
+    environment: Dict[str, object]
+    results: List[Result] = []
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Linear interpolation between closest ranks, `ordered` sorted ascending."""
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(
+    scenario: str,
+    params: dict,
+    latencies: List[float],
+    errors: int,
+    duration: float,
+    ttft: Optional[List[float]] = None,
+    extra: Optional[Dict[str, float]] = None,
+) -> Result:
+    """Build a result from the latencies (seconds) of the successful requests."""
+    return Result(
+        scenario=scenario,
+        params=params,
+        requests=len(latencies) + errors,
+        errors=errors,
+        duration_s=duration,
+        throughput_rps=len(latencies) / duration if duration > 0 else 0,
+        latency_ms=LatencyStats.of(latencies),
+        ttft_ms=LatencyStats.of(ttft) if ttft else None,
+        extra=extra or {},
+    )
+
+
+def environment() -> Dict[str, object]:
+    """What a result depends on besides the code: machine, python and commit."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def new_report() -> Report:
+    return Report(created_at=time.time(), environment=environment())
+
+
+def save(report: Report, path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(report.model_dump_json(indent=2))
+
+
+def load(path: str) -> Report:
+    with open(path, encoding="utf-8") as f:
+        return Report.model_validate(json.load(f))
+
+
+def format_table(report: Report) -> str:
+    lines = [
+        f"{'result':<48} {'req':>6} {'err':>5} {'rps':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft p50':>9}"
+    ]
+    for result in report.results:
+        latency = result.latency_ms
+        ttft = f"{result.ttft_ms.p50:9.1f}" if result.ttft_ms else f"{'-':>9}"
+        lines.append(
+            f"{result.key:<48} {result.requests:>6} {result.errors:>5} "
+            f"{result.throughput_rps:>9.2f} {latency.p50:>9.1f} {latency.p95:>9.1f} "
+            f"{latency.p99:>9.1f} {ttft}"
+        )
+        for name, value in result.extra.items():
+            lines.append(f"    {name}: {value:.2f}")
+    return "\n".join(lines)
+
+
+def compare(report: Report, baseline: Report, threshold: float = 0.10):
+    """Changes against a baseline: (table lines, keys of regressed results).
+
+    A result regresses when p50, p95 or p99 grew, or throughput dropped, by more
+    than `threshold` (a fraction). Results missing from either side are listed
+    but never regress.
+    """
+    previous = {result.key: result for result in baseline.results}
+    lines = [f"{'result':<48} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}"]
+    regressed = []
+    for result in report.results:
+        before = previous.pop(result.key, None)
+        if before is None:
+            lines.append(f"{result.key:<48} {'new':>9}")
+            continue
+        changes = {"rps": _change(before.throughput_rps, result.throughput_rps)}
+        for p in PERCENTILES:
+            changes[f"p{p}"] = _change(
+                getattr(before.latency_ms, f"p{p}"), getattr(result.latency_ms, f"p{p}")
+            )
+        worse = changes["rps"] < -threshold or any(
+            changes[f"p{p}"] > threshold for p in PERCENTILES
+        )
+        if worse:
+            regressed.append(result.key)
+        lines.append(
+            f"{result.key:<48} "
+            + " ".join(f"{changes[name]:>+9.1%}" for name in ("rps", "p50", "p95", "p99"))
+            + ("  REGRESSION" if worse else "")
+        )
+    for key in previous:
+        lines.append(f"{key:<48} {'missing':>9}")
+    return lines, regressed
+
+
+def _change(before: float, after: float) -> float:
+    if before == 0:
+        return 0.0
+    return (after - before) / before
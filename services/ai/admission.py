@@ -0,0 +1,149 @@
+"""
+Admission control for LLM generations.
+
+Ollama on CPU gets slower for everyone when it runs too many generations at
+once, so at most `max_concurrent` run at a time. Further requests wait in a
+bounded priority queue for at most `max_wait` seconds. A request that finds the
+queue full is rejected at once (429), and one that waits too long is rejected
+with 503. Both carry a Retry-After estimated from recent generation times.
+Admitted requests therefore keep a bounded latency instead of all slowing down
+together.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+QUEUE_DEPTH = Gauge("ai_admission_queue_depth", "Requests waiting for a generation slot")
+ACTIVE_GENERATIONS = Gauge("ai_admission_active", "Generations currently running")
+QUEUE_WAIT = Histogram(
+    "ai_admission_wait_seconds",
+    "Time admitted requests waited for a generation slot",
+    buckets=(0.005, 0.05, 0.25, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+REJECTED = Counter(
+    "ai_admission_rejected_total", "Requests rejected by admission control", ["reason"]
+)
+
+# lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; status_code is 429 or 503."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A generation slot; release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, prioritized wait queue."""
+
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        max_queue: int = 16,
+        max_wait: float = 60,
+        initial_duration: float = 10,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # moving average of generation time, for Retry-After
+        self._average_duration = initial_duration
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a request joining the queue now."""
+        rounds = (self.queue_depth + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(rounds * self._average_duration))
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> Slot:
+        """Wait for a generation slot, or raise AdmissionRejected."""
+        if self.active < self.max_concurrent and not self.queue_depth:
+            self.active += 1
+            ACTIVE_GENERATIONS.set(self.active)
+            QUEUE_WAIT.observe(0.0)
+            return Slot(self)
+        if self.queue_depth >= self.max_queue:
+            REJECTED.labels(reason="queue_full").inc()
+            raise AdmissionRejected(429, "queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        QUEUE_DEPTH.set(self.queue_depth)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                QUEUE_DEPTH.set(self.queue_depth)
+                REJECTED.labels(reason="timeout").inc()
+                raise AdmissionRejected(503, "timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # the client went away; give the slot on if it was already handed over
+            if future.done() and not future.cancelled():
+                future.result().release()
+            else:
+                future.cancel()
+            QUEUE_DEPTH.set(self.queue_depth)
+            raise
+        slot = future.result()
+        QUEUE_WAIT.observe(time.monotonic() - queued_at)
+        return slot
+
+    def _release(self, duration: float) -> None:
+        self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+        self.active -= 1
+        # hand the slot to the first waiter still interested
+        while self._queue and self.active < self.max_concurrent:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self.active += 1
+                future.set_result(Slot(self))
+        ACTIVE_GENERATIONS.set(self.active)
+        QUEUE_DEPTH.set(self.queue_depth)
+
+
+def request_priority(
+    prompt_length: int,
+    collection: Optional[str],
+    short_prompt_chars: int = 0,
+    priority_collections: frozenset = frozenset(),
+) -> int:
+    """Short prompts and premium collections skip ahead of the rest of the queue."""
+    if collection in priority_collections:
+        return PRIORITY_HIGH
+    if short_prompt_chars and prompt_length <= short_prompt_chars:
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
@@ -1,22 +1,112 @@
 """This Service contains the FastAPI application that will be used to serve the AI model.
-It will accept a conversation and return the response from the AI model."""
+It will accept a conversation and return the response from the AI model.
+/ask_stream relays the tokens as server-sent events while ollama generates them.
+Generations go through admission control (admission.py): a bounded number run at
+once, the rest wait in a bounded queue or are turned away with 429/503. They are
+spread over one or more ollama backends by llm_router.py.
+The model is kept loaded (keep_alive, warm-up at startup and on a schedule), prompts
+start with a fixed instruction prefix ollama can reuse from its cache, and follow-up
+turns continue from the conversation's previous ollama context, sending only the
+question and the passages it does not hold yet (ollama_context.py).
+The admission wait, prompt building and ollama's own durations are timed per
+request on /metrics (telemetry.py)."""
 
+import asyncio
+import json
 import logging
-from fastapi import FastAPI
+import os
+import time
+from typing import AsyncIterator, List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from prometheus_client import make_asgi_app
+from starlette.background import BackgroundTask
+import httpx
 from dotenv import find_dotenv, load_dotenv
+from admission import AdmissionController, AdmissionRejected, Slot, request_priority
+from llm_router import RETRYABLE_ERRORS, LLMRouter
+from ollama_context import ContextStore, SavedContext, Timings, passage_key
+from telemetry import TelemetryMiddleware, configure_metrics, record_stage, stage
 
 
 # service setup
 load_dotenv(find_dotenv())
 
 LLM_SERVICE_URL = "http://llm:11434"
+# comma separated ollama endpoints to spread generations over
+LLM_BACKENDS = [
+    url.strip() for url in os.getenv("LLM_BACKENDS", LLM_SERVICE_URL).split(",") if url.strip()
+]
+LLM_MODEL = os.getenv("LLM_MODEL", "gemma:2b")
+# how long ollama keeps the model loaded after a request, and how often (seconds) it
+# is warmed up again (0 only warms up at startup)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+LLM_WARMUP_INTERVAL = float(os.getenv("LLM_WARMUP_INTERVAL", "600"))
+# context window; every request and the warm-up must agree or ollama reloads the model
+# (a first turn of CONTEXT_TOKEN_BUDGET document tokens and its answer must leave
+# room for a follow-up, or contexts are never reused)
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+# follow-ups continue from the conversation's previous context while it leaves room
+# for the new prompt and LLM_ANSWER_RESERVE answer tokens
+LLM_REUSE_CONTEXT = os.getenv("LLM_REUSE_CONTEXT", "true").lower() == "true"
+LLM_ANSWER_RESERVE = int(os.getenv("LLM_ANSWER_RESERVE", "512"))
+LLM_CONTEXT_CACHE_SIZE = int(os.getenv("LLM_CONTEXT_CACHE_SIZE", "1000"))
+# generation on CPU can take minutes, connecting should not
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+# routing: retries on another backend after a connection error, extra requests a
+# collection's preferred backend may carry before load wins over affinity (-1 disables
+# affinity), errors before a backend is ejected and for how long, health check period
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+LLM_AFFINITY_SLACK = int(os.getenv("LLM_AFFINITY_SLACK", "1"))
+LLM_EJECT_FAILURES = int(os.getenv("LLM_EJECT_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+# admission control: generations run at once per backend (match OLLAMA_NUM_PARALLEL),
+# requests allowed to wait, and how long (seconds) they may wait before a 503
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "1"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+# queue priority: prompts up to this many characters (0 disables) and these
+# comma separated collections go first
+PRIORITY_PROMPT_CHARS = int(os.getenv("PRIORITY_PROMPT_CHARS", "0"))
+PRIORITY_COLLECTIONS = frozenset(
+    name.strip() for name in os.getenv("PRIORITY_COLLECTIONS", "").split(",") if name.strip()
+)
+# requests slower than this (milliseconds) are logged with their stage breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# shared keep-alive connection pools to the ollama backends
+llm_router = LLMRouter(
+    LLM_BACKENDS,
+    timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+    ),
+    retries=LLM_RETRIES,
+    affinity_slack=LLM_AFFINITY_SLACK,
+    eject_failures=LLM_EJECT_FAILURES,
+    eject_seconds=LLM_EJECT_SECONDS,
+    health_interval=LLM_HEALTH_INTERVAL,
+)
+
+admission = AdmissionController(
+    max_concurrent=LLM_MAX_CONCURRENT * len(llm_router.backends),
+    max_queue=LLM_QUEUE_SIZE,
+    max_wait=LLM_QUEUE_TIMEOUT,
+)
+
+contexts = ContextStore(max_size=LLM_CONTEXT_CACHE_SIZE, ttl_seconds=1800)
+
+# stage and request metrics are named ai_...
+configure_metrics("ai")
 
 app = FastAPI(
     title="AI Service",
@@ -29,35 +119,221 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+app.add_middleware(TelemetryMiddleware, slow_request_ms=SLOW_REQUEST_MS)
+app.mount("/metrics", make_asgi_app())
 
 
-# Define a function to answer queries
-def answer_question(question, docs) -> str:
-    try:
-        context = f"""You are an AI assistant with access to a collection of relevant documents. 
-Use the following information to provide accurate and helpful responses to user questions:
-<docs>
-{docs}
-</docs>
-Based on the above information, please provide the most suitable and detailed response to the following user's question.
+@app.on_event("startup")
+async def start_background_tasks():
+    llm_router.start()
+    # keep a reference, the loop only holds weak ones
+    app.state.warm_up_task = asyncio.get_running_loop().create_task(keep_warm())
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    app.state.warm_up_task.cancel()
+    await llm_router.close()
+
+
+async def warm_up() -> None:
+    """Load the model on every backend, with the options real requests use."""
+    payload = {
+        "model": LLM_MODEL,
+        "prompt": PROMPT_PREFIX,
+        "stream": False,
+        "keep_alive": LLM_KEEP_ALIVE,
+        "options": {"num_ctx": LLM_NUM_CTX, "num_predict": 1},
+    }
+
+    async def load(backend):
+        try:
+            response = await backend.client.post("/api/generate", json=payload)
+            response.raise_for_status()
+            logger.info(
+                "Warmed up %s on %s in %.0f ms",
+                LLM_MODEL,
+                backend.url,
+                Timings.from_ollama(response.json()).total_ms,
+            )
+        except Exception as e:
+            logger.warning("Error warming up %s: %s", backend.url, e)
+
+    await asyncio.gather(*(load(backend) for backend in llm_router.backends))
+
+
+async def keep_warm() -> None:
+    while True:
+        await warm_up()
+        if LLM_WARMUP_INTERVAL <= 0:
+            return
+        await asyncio.sleep(LLM_WARMUP_INTERVAL)
+
+
+# joins the passages a follow-up adds, as the orchestrator's context packing does
+DOCS_SEPARATOR = "\n"
+
+# identical for every request, so ollama can reuse its evaluation from the cache
+PROMPT_PREFIX = """You are an AI assistant with access to a collection of relevant documents.
+Use the following information to provide accurate and helpful responses to user questions.
+"""
+
+
+def build_prompt(question, docs, follow_up: bool = False) -> str:
+    """Instructions, then the collection's documents, then the question.
+
+    A follow-up continues an ollama context that already holds the instructions
+    and earlier documents, `docs` are only the new ones then.
+    """
+    docs_block = f"<docs>\n{docs}\n</docs>\n" if docs or not follow_up else ""
+    return f"""{"" if follow_up else PROMPT_PREFIX}{docs_block}Based on the above information, please provide the most suitable and detailed response to the following user's question.
 <question>
 {question}
 </question>
 """
 
-        generate_payload = {"model": "gemma:2b", "prompt": context, "stream": False}
-        response = requests.post(
-            f"{LLM_SERVICE_URL}/api/generate", json=generate_payload
+
+def generate_payload(conversation_id, question, docs, passages, turn, stream: bool):
+    """Ollama /api/generate payload, continuing the conversation's context if it fits.
+
+    `passages` are the documents `docs` was joined from, compared whole with the
+    ones the context holds; without them `docs` counts as a single passage.
+    Returns the payload and the keys of the passages its context will hold.
+    """
+    payload = {
+        "model": LLM_MODEL,
+        "stream": stream,
+        "keep_alive": LLM_KEEP_ALIVE,
+        "options": {"num_ctx": LLM_NUM_CTX},
+    }
+    if passages is None:
+        passages = [docs] if docs.strip() else []
+    keys = {passage_key(passage) for passage in passages}
+    saved = contexts.get(conversation_id) if LLM_REUSE_CONTEXT else None
+    # the context must have seen every turn of the conversation, cached answers included
+    if saved is not None and turn is not None and saved.turn == turn:
+        new_docs = DOCS_SEPARATOR.join(
+            passage for passage in passages if passage_key(passage) not in saved.passages
+        )
+        prompt = build_prompt(question, new_docs, follow_up=True)
+        # about 4 characters per token
+        if len(saved.tokens) + len(prompt) // 4 + LLM_ANSWER_RESERVE <= LLM_NUM_CTX:
+            payload["context"] = saved.tokens
+            payload["prompt"] = prompt
+            return payload, saved.passages | keys
+    payload["prompt"] = build_prompt(question, docs)
+    return payload, keys
+
+
+def finish(conversation_id, turn, payload: dict, passages, output: dict) -> dict:
+    """Remember the new context and describe the generation."""
+    if LLM_REUSE_CONTEXT:
+        contexts.set(
+            conversation_id,
+            SavedContext(
+                tokens=output.get("context") or [],
+                # the orchestrator saves the question and the answer next
+                turn=None if turn is None else turn + 2,
+                passages=passages,
+            ),
+        )
+    timings = Timings.from_ollama(output)
+    # where the generation time went, as ollama measured it
+    record_stage("ollama_load", timings.load_ms / 1000)
+    record_stage("ollama_prompt_eval", timings.prompt_eval_ms / 1000)
+    record_stage("ollama_eval", timings.eval_ms / 1000)
+    return {
+        "timings": timings,
+        "context_reused": "context" in payload,
+    }
+
+
+# Define a function to answer queries
+async def answer_question(
+    question, docs, conversation_id=None, turn=None, passages=None
+) -> dict:
+    """Generate an answer: {"answer", "timings", "context_reused"}."""
+    with stage("prompt_build"):
+        payload, passages = generate_payload(
+            conversation_id, question, docs, passages, turn, stream=False
+        )
+    with stage("llm_generate"):
+        response = await llm_router.post(
+            "/api/generate", affinity=affinity(conversation_id), json=payload
         )
         response.raise_for_status()
-        output = response.json()
-        # Return the response
-        return output["response"]
-    except Exception as e:
-        logger.error(f"Error answering question: {question}")
-        logger.error(e)
-        return "I am sorry, There was an error processing your request"
+    output = response.json()
+    return {
+        "answer": output["response"],
+        **finish(conversation_id, turn, payload, passages, output),
+    }
+
+
+async def stream_answer(
+    question, docs, conversation_id=None, turn=None, passages=None
+) -> AsyncIterator[dict]:
+    """Yield {"token"} events as ollama streams them, then the final {"done"} event."""
+    with stage("prompt_build"):
+        payload, passages = generate_payload(
+            conversation_id, question, docs, passages, turn, stream=True
+        )
+    started = time.perf_counter()
+    async with llm_router.stream(
+        "POST", "/api/generate", affinity=affinity(conversation_id), json=payload
+    ) as response:
+        response.raise_for_status()
+        # ollama streams one json object per line
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if chunk.get("response"):
+                if started is not None:
+                    record_stage("llm_first_token", time.perf_counter() - started)
+                    started = None
+                yield {"token": chunk["response"]}
+            if chunk.get("done"):
+                done = finish(conversation_id, turn, payload, passages, chunk)
+                yield {
+                    "done": True,
+                    "timings": done["timings"].model_dump(),
+                    "context_reused": done["context_reused"],
+                }
+                break
+
+
+async def admit(conversation_id: str, question: str, docs: str) -> Slot:
+    """Wait for a generation slot, or fail fast with 429/503 and a Retry-After."""
+    priority = request_priority(
+        len(question) + len(docs),
+        conversation_id,
+        PRIORITY_PROMPT_CHARS,
+        PRIORITY_COLLECTIONS,
+    )
+    try:
+        with stage("admission_wait"):
+            return await admission.acquire(priority)
+    except AdmissionRejected as e:
+        logger.warning("Rejected conversation %s: %s", conversation_id, e.reason)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"The AI service is overloaded ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def affinity(conversation_id: Optional[str]):
+    """Routing key keeping a collection on the backend whose prompt cache is warm."""
+    return conversation_id if LLM_AFFINITY_SLACK >= 0 else None
+
+
+def sse_event(data: dict) -> str:
+    """Format a server-sent event."""
+    return f"data: {json.dumps(data)}\n\n"
 
 
 @app.get("/")
@@ -71,6 +347,11 @@ class ChatRequestModel(BaseModel):
 
     question: str
     docs: str
+    # the passages docs was joined from, so a follow-up only sends the new ones
+    passages: Optional[List[str]] = None
+    # messages in the stored conversation before this question; a follow-up only
+    # continues a context that has seen all of them
+    turn: Optional[int] = None
 
 
 class ChatResponseModel(BaseModel):
@@ -78,20 +359,76 @@ class ChatResponseModel(BaseModel):
 
     answer: str
     query: str
+    timings: Optional[Timings] = None
+    # whether the generation continued the conversation's previous ollama context
+    context_reused: bool = False
 
 
 @app.post("/ask/{conversation_id}")
-async def chat_conversation(request: ChatRequestModel):
+async def chat_conversation(conversation_id: str, request: ChatRequestModel):
     """Send a conversation to the AI model and return the response."""
+    slot = await admit(conversation_id, request.question, request.docs)
     try:
         query, docs = request.question, request.docs
         logger.info("Sending conversation with ID  to AI model")
 
-        answer = answer_question(query, docs)
+        result = await answer_question(
+            query, docs, conversation_id, request.turn, request.passages
+        )
 
-        return ChatResponseModel(answer=answer, query=query)
+        return ChatResponseModel(query=query, **result)
 
+    except RETRYABLE_ERRORS as e:
+        logger.error("No LLM backend reachable: ")
+        logger.error(e)
+        raise HTTPException(
+            status_code=503,
+            detail="The LLM backend is unreachable, retry later",
+            headers={"Retry-After": "5"},
+        )
     except Exception as e:
+        # a failed generation leaves no usable context
+        contexts.discard(conversation_id)
         logger.error("Error processing conversation: ")
         logger.error(e)
-        return {"error": str(e)}
+        raise HTTPException(status_code=502, detail=f"The LLM backend failed: {e}")
+    finally:
+        slot.release()
+
+
+@app.post("/ask_stream/{conversation_id}")
+async def chat_conversation_stream(conversation_id: str, request: ChatRequestModel):
+    """Stream the AI model's answer as server-sent events.
+
+    Every event carries either a {"token"}, the final {"done": true} (with the
+    timings and context_reused) or an {"error"}. The generation slot is held
+    until the stream ends.
+    """
+    query, docs = request.question, request.docs
+    slot = await admit(conversation_id, query, docs)
+    logger.info("Streaming conversation to AI model")
+
+    async def events():
+        try:
+            async for event in stream_answer(
+                query, docs, conversation_id, request.turn, request.passages
+            ):
+                yield sse_event(event)
+        except Exception as e:
+            # a broken generation leaves no usable context
+            contexts.discard(conversation_id)
+            logger.error(f"Error streaming answer to question: {query}")
+            logger.error(e)
+            yield sse_event(
+                {"error": "I am sorry, There was an error processing your request"}
+            )
+        finally:
+            slot.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # releases the slot even if the stream never started
+        background=BackgroundTask(slot.release),
+    )
@@ -0,0 +1,186 @@
+"""
+Routing of generations over several Ollama backends.
+
+Each request goes to the healthy backend with the fewest outstanding requests,
+ties broken by recent latency. With an affinity key (the collection), requests
+prefer the backend chosen for that key by rendezvous hashing, as long as it is
+not more than `affinity_slack` requests busier than the least loaded one, so a
+collection's prompt prefix stays warm in one backend's cache.
+
+Backends are probed in the background (active health checks) and ejected for
+`eject_seconds` after `eject_failures` consecutive errors (passive checks).
+Connection failures are retried on a different backend; once a backend has
+accepted a request it is never sent twice.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Iterable, List, Optional
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BACKEND_OUTSTANDING = Gauge(
+    "ai_llm_backend_outstanding", "Requests in flight per LLM backend", ["backend"]
+)
+BACKEND_HEALTHY = Gauge(
+    "ai_llm_backend_healthy", "1 if the LLM backend is routable", ["backend"]
+)
+BACKEND_REQUESTS = Counter(
+    "ai_llm_backend_requests_total", "Requests sent per LLM backend", ["backend", "outcome"]
+)
+
+# errors raised before a backend received the request, safe to retry elsewhere
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class Backend:
+    """One Ollama endpoint and its load and health state."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+        self.outstanding = 0
+        # moving average of the time to response headers
+        self.latency = 0.0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and time.monotonic() >= self.ejected_until
+
+    def record_success(self, latency: float) -> None:
+        self.failures = 0
+        self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+        BACKEND_REQUESTS.labels(backend=self.url, outcome="ok").inc()
+
+    def record_failure(self, eject_failures: int, eject_seconds: float) -> None:
+        self.failures += 1
+        BACKEND_REQUESTS.labels(backend=self.url, outcome="error").inc()
+        if self.failures >= eject_failures:
+            logger.warning("Ejecting LLM backend %s for %.0fs", self.url, eject_seconds)
+            self.ejected_until = time.monotonic() + eject_seconds
+            self.failures = 0
+            BACKEND_HEALTHY.labels(backend=self.url).set(0)
+
+
+class LLMRouter:
+    """Least-outstanding routing with health checks, ejection and retries."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: httpx.Timeout,
+        limits: httpx.Limits,
+        retries: int = 1,
+        affinity_slack: int = 1,
+        eject_failures: int = 3,
+        eject_seconds: float = 30,
+        health_interval: float = 10,
+    ):
+        self.backends = [
+            Backend(url, httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits))
+            for url in urls
+        ]
+        self.retries = retries
+        # affinity yields to load once the preferred backend is this much busier
+        self.affinity_slack = affinity_slack
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self._health_task: Optional[asyncio.Task] = None
+        for backend in self.backends:
+            BACKEND_HEALTHY.labels(backend=backend.url).set(1)
+
+    def choose(self, affinity: Optional[str] = None, exclude: Iterable[str] = ()) -> Backend:
+        candidates = [b for b in self.backends if b.url not in exclude]
+        if not candidates:
+            raise RuntimeError("No LLM backend left to try")
+        # when every backend looks down, trying one beats failing outright
+        candidates = [b for b in candidates if b.available] or candidates
+        least = min(candidates, key=lambda b: (b.outstanding, b.latency))
+        if affinity is None:
+            return least
+        preferred = max(
+            candidates,
+            key=lambda b: hashlib.sha256(f"{affinity}:{b.url}".encode("utf-8")).digest(),
+        )
+        if preferred.outstanding <= least.outstanding + self.affinity_slack:
+            return preferred
+        return least
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, affinity: Optional[str] = None, **kwargs):
+        """Send a request to a backend and yield its streaming response."""
+        tried = set()
+        for attempt in range(self.retries + 1):
+            backend = self.choose(affinity, tried)
+            tried.add(backend.url)
+            backend.outstanding += 1
+            BACKEND_OUTSTANDING.labels(backend=backend.url).set(backend.outstanding)
+            started = time.monotonic()
+            try:
+                try:
+                    response = await backend.client.send(
+                        backend.client.build_request(method, path, **kwargs), stream=True
+                    )
+                except RETRYABLE_ERRORS as e:
+                    backend.record_failure(self.eject_failures, self.eject_seconds)
+                    if attempt == self.retries or len(tried) == len(self.backends):
+                        raise
+                    logger.warning("LLM backend %s unreachable, retrying: %s", backend.url, e)
+                    continue
+                except Exception:
+                    backend.record_failure(self.eject_failures, self.eject_seconds)
+                    raise
+                if response.status_code >= 500:
+                    backend.record_failure(self.eject_failures, self.eject_seconds)
+                else:
+                    backend.record_success(time.monotonic() - started)
+                try:
+                    yield response
+                finally:
+                    await response.aclose()
+                return
+            finally:
+                backend.outstanding -= 1
+                BACKEND_OUTSTANDING.labels(backend=backend.url).set(backend.outstanding)
+
+    async def post(self, path: str, affinity: Optional[str] = None, **kwargs) -> httpx.Response:
+        """Send a request to a backend and return the complete response."""
+        async with self.stream("POST", path, affinity, **kwargs) as response:
+            await response.aread()
+            return response
+
+    async def check(self, backend: Backend) -> None:
+        try:
+            response = await backend.client.get("/api/version", timeout=5)
+            healthy = response.status_code == 200
+        except Exception:
+            healthy = False
+        if healthy != backend.healthy:
+            logger.info("LLM backend %s is %s", backend.url, "up" if healthy else "down")
+        backend.healthy = healthy
+        BACKEND_HEALTHY.labels(backend=backend.url).set(1 if backend.available else 0)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    def start(self) -> None:
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for backend in self.backends:
+            await backend.client.aclose()
@@ -0,0 +1,93 @@
+"""
+Ollama generation state kept between requests.
+
+Ollama returns a `context` (the token ids of the prompt and answer) with every
+generation. Sending it back with a follow-up in the same conversation lets the
+backend that still holds those tokens in its KV cache skip re-evaluating them,
+so the follow-up prompt only needs the question and the passages the context
+does not hold yet. Contexts are kept per conversation in a bounded LRU with an
+idle TTL, and only reused while they leave room in the model's context window and
+have seen every turn of the stored conversation: answers served from the
+orchestrator's cache never reach this service, and continuing a context that
+missed them would drift from the conversation.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set
+
+from pydantic import BaseModel
+
+
+class Timings(BaseModel):
+    """Durations reported by ollama for a generation, in milliseconds."""
+
+    total_ms: float = 0
+    load_ms: float = 0
+    prompt_eval_ms: float = 0
+    eval_ms: float = 0
+    prompt_eval_count: int = 0
+    eval_count: int = 0
+
+    @classmethod
+    def from_ollama(cls, output: dict) -> "Timings":
+        # ollama reports nanoseconds
+        return cls(
+            total_ms=output.get("total_duration", 0) / 1e6,
+            load_ms=output.get("load_duration", 0) / 1e6,
+            prompt_eval_ms=output.get("prompt_eval_duration", 0) / 1e6,
+            eval_ms=output.get("eval_duration", 0) / 1e6,
+            prompt_eval_count=output.get("prompt_eval_count", 0),
+            eval_count=output.get("eval_count", 0),
+        )
+
+
+class SavedContext(BaseModel):
+    """A conversation's last ollama context and what it holds."""
+
+    tokens: List[int]
+    # messages of the stored conversation the context has seen, None if unknown
+    turn: Optional[int] = None
+    # passage_key of every document passage already in the context
+    passages: Set[str] = set()
+
+
+def passage_key(passage: str) -> str:
+    return hashlib.sha1(passage.strip().encode("utf-8")).hexdigest()
+
+
+class ContextStore:
+    """LRU of the last ollama context of each conversation."""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 1800):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[SavedContext, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> Optional[SavedContext]:
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            context, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[conversation_id]
+                return None
+            self._entries.move_to_end(conversation_id)
+            return context
+
+    def set(self, conversation_id: str, context: SavedContext) -> None:
+        if not context.tokens:
+            return
+        with self._lock:
+            self._entries[conversation_id] = (context, time.monotonic())
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, conversation_id: str) -> None:
+        with self._lock:
+            self._entries.pop(conversation_id, None)
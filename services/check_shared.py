@@ -0,0 +1,35 @@
+"""
+Check that the modules copied into every service are identical.
+
+Each service is its own docker build context, so shared code cannot be
+imported across them and is copied instead. Run after editing a copy:
+
+  python services/check_shared.py
+"""
+
+import filecmp
+import os
+import sys
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED = {
+    "telemetry.py": ("ai", "orchastrator", "retrival"),
+    "answer_keys.py": ("orchastrator", "retrival"),
+}
+
+
+def main() -> int:
+    drifted = []
+    for name, services in SHARED.items():
+        reference = os.path.join(SERVICES_DIR, services[0], name)
+        for service in services[1:]:
+            copy = os.path.join(SERVICES_DIR, service, name)
+            if not filecmp.cmp(reference, copy, shallow=False):
+                drifted.append(f"{services[0]}/{name} and {service}/{name} differ")
+    for line in drifted:
+        print(line)
+    return 1 if drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Per-collection answer cache in Redis.
+
+A question is answered from the cache when its normalized text matches a cached
+question exactly, or when its embedding (from the retrieval service's /embed) is
+at least `similarity` cosine-similar to a cached question's. Each collection
+keeps at most `max_entries` answers under three keys:
+
+    answers:{collection}:entries  hash  digest -> {"question", "answer", "stored_at"}
+    answers:{collection}:vectors  hash  digest -> float32 embedding
+    answers:{collection}:used     zset  digest -> last use time (LRU order)
+
+The keys expire `ttl_seconds` after the last write and every entry is ignored
+once it is older than that. The retrieval service deletes the keys when the
+collection is re-ingested or deleted; their names come from answer_keys.py,
+which both services share.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import time
+import unicodedata
+from array import array
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from answer_keys import answer_cache_keys
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Normalize a question so trivially different spellings share an entry."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def _unit(vector: List[float]) -> array:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return array("f", (value / norm for value in vector))
+
+
+class AnswerCache:
+    """Exact and semantic answer lookups for a collection."""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        embed: Callable[[str], Awaitable[List[float]]],
+        similarity: float = 0.95,
+        ttl_seconds: int = 3600,
+        max_entries: int = 100,
+    ):
+        self.client = client
+        self.embed = embed
+        # 1 or more disables semantic matching, only exact repeats are served
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @staticmethod
+    def digest(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    async def lookup(
+        self, collection: str, question: str
+    ) -> Tuple[Optional[str], Optional[array]]:
+        """Return (cached answer or None, the question's embedding if one was computed)."""
+        entries_key, vectors_key, used_key = answer_cache_keys(collection)
+        digest = self.digest(question)
+        answer = self._valid(await self.client.hget(entries_key, digest))
+        if answer is not None:
+            await self.client.zadd(used_key, {digest: time.time()})
+            return answer, None
+        if self.similarity >= 1:
+            return None, None
+
+        vector = _unit(await self.embed(question))
+        best, best_score = None, self.similarity
+        for candidate, data in (await self.client.hgetall(vectors_key)).items():
+            cached = array("f")
+            cached.frombytes(data)
+            if len(cached) != len(vector):
+                continue
+            score = sum(a * b for a, b in zip(vector, cached))
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None, vector
+        answer = self._valid(await self.client.hget(entries_key, best))
+        if answer is None:
+            return None, vector
+        logger.info("Semantic answer cache hit for %s (%.3f)", collection, best_score)
+        await self.client.zadd(used_key, {best: time.time()})
+        return answer, vector
+
+    async def store(
+        self,
+        collection: str,
+        question: str,
+        answer: str,
+        vector: Optional[array] = None,
+    ) -> None:
+        """Cache an answer, evicting the least recently used entries past max_entries."""
+        entries_key, vectors_key, used_key = answer_cache_keys(collection)
+        digest = self.digest(question)
+        if vector is None and self.similarity < 1:
+            vector = _unit(await self.embed(question))
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                entries_key,
+                digest,
+                json.dumps({"question": question, "answer": answer, "stored_at": now}),
+            )
+            if vector is not None:
+                pipe.hset(vectors_key, digest, vector.tobytes())
+            pipe.zadd(used_key, {digest: now})
+            for key in (entries_key, vectors_key, used_key):
+                pipe.expire(key, self.ttl_seconds)
+            pipe.zcard(used_key)
+            size = (await pipe.execute())[-1]
+        if size > self.max_entries:
+            evicted = [
+                member for member, _ in await self.client.zpopmin(used_key, size - self.max_entries)
+            ]
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hdel(entries_key, *evicted)
+                pipe.hdel(vectors_key, *evicted)
+                await pipe.execute()
+
+    async def invalidate(self, collection: str) -> None:
+        await self.client.delete(*answer_cache_keys(collection))
+
+    def _valid(self, raw) -> Optional[str]:
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        if time.time() - entry["stored_at"] > self.ttl_seconds:
+            return None
+        return entry["answer"]
@@ -1,19 +1,148 @@
-"""Main FastAPI application. manages the conversation between the user and the ai assistant."""
-
+"""Main FastAPI application. manages the conversation between the user and the ai assistant.
+
+All upstream calls are non-blocking: the retrieval and AI services are reached through
+shared httpx.AsyncClient connection pools and redis through redis.asyncio.
+/ask_stream relays the AI service's token stream and saves the answer once it completes.
+Conversations are append-only redis lists (see conversation_store.py) and answers
+are cached per collection for repeated or near-identical questions (answer_cache.py).
+Identical questions arriving while one is being answered share its generation
+(single_flight.py). Retrieved chunks are packed into a token budget (context_packing.py).
+Requests carry an X-Request-ID across the services and their stages are timed on
+/metrics (telemetry.py).
+"""
+
+import asyncio
 import logging
-from typing import List
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
 import json
-import redis
-import requests
-from fastapi import FastAPI, UploadFile, File
+import time
+import httpx
+import msgpack
+import redis.asyncio as redis
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import Histogram, make_asgi_app
 from pydantic import BaseModel
 from uuid import uuid4
 
+from answer_cache import AnswerCache
+from context_packing import PackedContext, Tokenizer, pack_context
+from conversation_store import ConversationStore
+from single_flight import Flight, SingleFlight
+from telemetry import (
+    TelemetryMiddleware,
+    configure_metrics,
+    propagate_request_id,
+    record_stage,
+    stage,
+)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-r = redis.Redis(host="redis", port=6379, db=0)
+RETRIVAL_SERVICE_URL = "http://retrival:8000"
+AI_SERVICE_URL = "http://ai:8000"
+
+# per-upstream timeouts (seconds); generation on CPU can take minutes
+RETRIVAL_TIMEOUT = float(os.getenv("RETRIVAL_TIMEOUT", "30"))
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "300"))
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", "5"))
+# connection pool limits, per upstream
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+# conversations expire after this many idle seconds (0 keeps them forever)
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", str(7 * 24 * 3600)))
+# only the most recent messages of a conversation are kept (0 keeps all)
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "200"))
+# answer cache: cosine similarity needed for a semantic hit (1 = exact repeats only),
+# lifetime of an answer in seconds, and answers kept per collection
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "100"))
+# uploads forwarded to the retrieval service at once, and how long (seconds) one
+# may take when the file is ingested synchronously; compare settings with
+# `loadtest.py upload --files-per-request`
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "600"))
+# context packing: chunks retrieved per question, token budget of the packed context
+# (0 = unlimited) and the tokenizer counting it: the generation model's (gemma:2b)
+# tokenizer.json baked into the image, rebuild with CONTEXT_TOKENIZER_REPO to match
+# another LLM_MODEL
+# (the defaults keep prompts no longer than the 4 unpacked chunks sent before packing)
+CONTEXT_RETRIEVE_K = int(os.getenv("CONTEXT_RETRIEVE_K", "4"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "/models/tokenizer.json")
+# identical in-flight questions share one generation, across workers through redis
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# requests slower than this (milliseconds) are logged with their stage breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+r = redis.Redis(host="redis", port=6379, db=0, max_connections=REDIS_MAX_CONNECTIONS)
+conversations = ConversationStore(
+    r, ttl_seconds=CONVERSATION_TTL, max_messages=CONVERSATION_MAX_MESSAGES
+)
+upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+context_tokenizer = Tokenizer(CONTEXT_TOKENIZER)
+CONTEXT_TOKENS = Histogram(
+    "orchastrator_context_tokens",
+    "Tokens of the packed context sent to the AI service",
+    buckets=(64, 128, 256, 512, 1024, 1536, 2048, 4096, 8192),
+)
+CONTEXT_TOKENS_SAVED = Histogram(
+    "orchastrator_context_tokens_saved",
+    "Tokens removed by overlap merging and the token budget",
+    buckets=(0, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+flights = SingleFlight(
+    r, lock_ttl_seconds=int(AI_TIMEOUT) + 30, wait_timeout=AI_TIMEOUT
+)
+
+http_limits = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+)
+retrival_client = httpx.AsyncClient(
+    base_url=RETRIVAL_SERVICE_URL,
+    timeout=httpx.Timeout(RETRIVAL_TIMEOUT, connect=CONNECT_TIMEOUT),
+    limits=http_limits,
+    event_hooks={"request": [propagate_request_id]},
+)
+ai_client = httpx.AsyncClient(
+    base_url=AI_SERVICE_URL,
+    timeout=httpx.Timeout(AI_TIMEOUT, connect=CONNECT_TIMEOUT),
+    limits=http_limits,
+    event_hooks={"request": [propagate_request_id]},
+)
+
+
+async def embed_question(question: str) -> List[float]:
+    """Embed a question with the retrieval service's (cached) query model."""
+    with stage("embed_question"):
+        response = await retrival_client.post("/embed", json={"texts": [question]})
+    response.raise_for_status()
+    return response.json()["embeddings"][0]
+
+
+answer_cache = (
+    AnswerCache(
+        r,
+        embed=embed_question,
+        similarity=ANSWER_CACHE_SIMILARITY,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    )
+    if ANSWER_CACHE_ENABLED
+    else None
+)
+
+
+# stage and request metrics are named orchastrator_...
+configure_metrics("orchastrator")
 
 app = FastAPI(
     title="Chatbot Service",
@@ -26,10 +155,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "ETag"],
 )
+app.add_middleware(TelemetryMiddleware, slow_request_ms=SLOW_REQUEST_MS)
+app.mount("/metrics", make_asgi_app())
+
+
+@app.on_event("startup")
+async def load_tokenizer():
+    # tokens are estimated until the tokenizer is loaded, startup does not wait for it
+    asyncio.get_running_loop().run_in_executor(None, context_tokenizer.load)
 
-RETRIVAL_SERVICE_URL = "http://retrival:8000"
-AI_SERVICE_URL = "http://ai:8000"
+
+@app.on_event("shutdown")
+async def close_clients():
+    await retrival_client.aclose()
+    await ai_client.aclose()
+    await r.aclose()
 
 
 class Message(BaseModel):
@@ -43,26 +185,46 @@ class Conversation(BaseModel):
     """Conversation model for the chatbot."""
 
     conversation: List[Message]
+    # absolute index of the first returned message
+    start: int = 0
+    # number of messages ever added to the conversation
+    total: int = 0
 
 
 @app.get("/collectionChat/{conversation_id}")
-async def get_conversation(conversation_id: str) -> Conversation:
-    """Get the conversation from the Redis store."""
+async def get_conversation(
+    conversation_id: str, last: Optional[int] = None, since: Optional[int] = None
+) -> Conversation:
+    """Get the conversation from the Redis store.
+
+    `last` returns only the last N messages and `since` only the messages whose
+    index is at least `since`, so clients can fetch what they have not seen.
+    """
     try:
         logger.info("Retrieving initial id %s", conversation_id)
-        existing_conversation_json = r.get(conversation_id)
-        if existing_conversation_json:
-            existing_conversation = json.loads(existing_conversation_json)  # type: ignore
-            return existing_conversation
-        else:
+        start, total, messages = await load_conversation(conversation_id, since, last)
+        if total == 0:
             return Conversation(
                 conversation=[
                     {"role": "assistant", "content": "hi how can i help you?"}
                 ]
             )
+        return Conversation(conversation=messages, start=start, total=total)
     except Exception as e:
         logger.error("Error retrieving conversation %s", e)
-        return {"error": e}
+        return {"error": str(e)}
+
+
+class AnswerMessage(Message):
+    """Assistant answer, flagged when served from the answer cache or a shared generation."""
+
+    cached: bool = False
+    coalesced: bool = False
+    # size of the packed context and tokens packing removed, for fresh answers
+    context_tokens: Optional[int] = None
+    context_tokens_saved: Optional[int] = None
+    # ollama's load / prompt-eval / eval durations, for fresh answers
+    timings: Optional[dict] = None
 
 
 class postConversationModel(BaseModel):
@@ -73,57 +235,248 @@ class postConversationModel(BaseModel):
 @app.post("/ask/{conversation_id}")
 async def post_conversation(
     request: postConversationModel,
-) -> Message:
+) -> AnswerMessage:
     """Send the conversation to the AI model and return the response."""
     conversation_id, question = request.conversation_id, request.question
     logger.info("Sending Conversation with ID %s to ", conversation_id)
     try:
-        existing_conversation_json = r.get(conversation_id)
-        if existing_conversation_json:
-            existing_conversation = json.loads(existing_conversation_json)  # type: ignore
-        else:
-            existing_conversation = {
-                "conversation": [
-                    {"role": "system", "content": "You are a helpful assistant."}
-                ]
-            }
-
-        existing_conversation["conversation"].append(
-            {"role": "user", "content": question}
+        cached, vector = await lookup_answer(conversation_id, question)
+        if cached is not None:
+            await save_turn(conversation_id, question, cached)
+            return AnswerMessage(role="assistant", content=cached, cached=True)
+
+        async with in_flight(conversation_id, question) as flight:
+            answer, context, timings = flight.result, None, None
+            if answer is None:
+                context = await retrieve_docs(conversation_id, question)
+                with stage("ai"):
+                    response = await ai_client.post(
+                        f"/ask/{conversation_id}",
+                        json={
+                            "conversation_id": conversation_id,
+                            "question": question,
+                            "docs": context.text,
+                            "passages": context.passage_texts,
+                            "turn": await conversations.count(conversation_id),
+                        },
+                    )
+                    response.raise_for_status()
+                output = response.json()
+                if "answer" not in output:
+                    logger.error("No answer from the AI service: %s", output.get("error"))
+                    raise HTTPException(
+                        status_code=502,
+                        detail=output.get("error") or "The AI service returned no answer",
+                    )
+                answer, timings = output["answer"], output.get("timings")
+                await flight.publish(answer)
+
+        # every caller records the turn in its own conversation
+        await save_turn(conversation_id, question, answer)
+        if not flight.coalesced:
+            await store_answer(conversation_id, question, answer, vector)
+
+        return AnswerMessage(
+            role="assistant",
+            content=answer,
+            coalesced=flight.coalesced,
+            context_tokens=context.tokens if context else None,
+            context_tokens_saved=context.tokens_saved if context else None,
+            timings=timings,
         )
-        docs = requests.post(
-            f"{RETRIVAL_SERVICE_URL}/retrieve_document/",
-            json={"query": question, "collection_id": conversation_id},
-        ).json()["documents"]
-        docs = format_docs(docs=docs)
-
-        response = requests.post(
-            f"{AI_SERVICE_URL}/ask/{conversation_id}",
-            json={
-                "conversation_id": conversation_id,
-                "question": question,
-                "docs": docs,
-            },
+    except httpx.HTTPStatusError as e:
+        try:
+            detail = e.response.json().get("detail")
+        except ValueError:
+            detail = None
+        if e.response.status_code not in (429, 503):
+            logger.error("Error processing conversation %s", e)
+            raise HTTPException(status_code=502, detail=detail or str(e))
+        # the AI service shed the request, let the client back off as told
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=detail or "The AI service is unavailable",
+            headers={"Retry-After": e.response.headers.get("Retry-After", "1")},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error processing conversation %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def load_conversation(
+    conversation_id: str, since: Optional[int] = None, last: Optional[int] = None
+):
+    """Load a window of a conversation: (start index, total count, messages).
+
+    Conversations saved by older versions as one JSON blob are moved to the list
+    layout the first time they are read.
+    """
+    start, total, messages = await conversations.read(conversation_id, since, last)
+    if total == 0 and await conversations.migrate_legacy(conversation_id):
+        start, total, messages = await conversations.read(conversation_id, since, last)
+    return start, total, messages
+
+
+async def save_turn(conversation_id: str, question: str, answer: str) -> None:
+    with stage("conversation_append"):
+        await conversations.append(
+            conversation_id,
+            [
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": answer},
+            ],
         )
-        response.raise_for_status()
-        assistant_message = response.json()["answer"]
-        bot_message = {"role": "assistant", "content": assistant_message}
-        existing_conversation["conversation"].append(bot_message)
 
-        r.set(conversation_id, json.dumps(existing_conversation))
 
-        return bot_message
+async def lookup_answer(conversation_id: str, question: str):
+    """Look a question up in the answer cache: (answer or None, question embedding)."""
+    if answer_cache is None:
+        return None, None
+    try:
+        with stage("answer_cache_lookup"):
+            return await answer_cache.lookup(conversation_id, question)
     except Exception as e:
-        logger.error("Error processing conversation %s", e)
-        return {"error": e}
+        # the cache is an optimization, answer normally when it is unavailable
+        logger.warning("Error reading answer cache %s", e)
+        return None, None
 
 
-def format_docs(docs) -> str:
-    """Format the documents for the AI model."""
-    formatted_docs = []
-    for doc in docs:
-        formatted_docs.append(doc["page_content"])
-    return "\n".join(formatted_docs)
+async def store_answer(conversation_id: str, question: str, answer: str, vector) -> None:
+    if answer_cache is None or not answer:
+        return
+    try:
+        with stage("answer_cache_store"):
+            await answer_cache.store(conversation_id, question, answer, vector)
+    except Exception as e:
+        logger.warning("Error writing answer cache %s", e)
+
+
+@asynccontextmanager
+async def in_flight(conversation_id: str, question: str):
+    """Join the generation of an identical question, or become its leader."""
+    key = f"{conversation_id}:{AnswerCache.digest(question)}"
+    if not SINGLE_FLIGHT_ENABLED:
+        yield Flight(flights, key, None, leader=False)
+        return
+    started = time.perf_counter()
+    async with flights.flight(key) as flight:
+        # followers spend this waiting for the leader's answer
+        record_stage("single_flight", time.perf_counter() - started)
+        yield flight
+
+
+async def retrieve_docs(conversation_id: str, question: str) -> PackedContext:
+    """Retrieve the documents relevant to a question, packed for the AI model."""
+    with stage("retrieval"):
+        retrival_response = await retrival_client.post(
+            "/retrieve_document",
+            json={
+                "query": question,
+                "collection_id": conversation_id,
+                "k": CONTEXT_RETRIEVE_K,
+                # packing needs the text and the chunk position, nothing else
+                "fields": ["page_content", "metadata"],
+            },
+            headers={"Accept": "application/msgpack"},
+        )
+        retrival_response.raise_for_status()
+        if retrival_response.headers.get("content-type", "").startswith("application/msgpack"):
+            body = msgpack.unpackb(retrival_response.content)
+        else:
+            body = retrival_response.json()
+    with stage("context_packing"):
+        context = pack_context(body["documents"], CONTEXT_TOKEN_BUDGET, context_tokenizer)
+    CONTEXT_TOKENS.observe(context.tokens)
+    CONTEXT_TOKENS_SAVED.observe(context.tokens_saved)
+    logger.info(
+        "Packed %d chunks into %d passages, %d tokens (%d saved)",
+        context.chunks,
+        context.passages,
+        context.tokens,
+        context.tokens_saved,
+    )
+    return context
+
+
+@app.post("/ask_stream/{conversation_id}")
+async def post_conversation_stream(request: postConversationModel):
+    """Stream the AI model's answer as server-sent events.
+
+    The events of the AI service are relayed as they arrive; the question and the
+    answer are saved to the conversation once the stream completes. A cached
+    answer, or one shared with an identical request already in flight, is sent as
+    a single token followed by a done event with "cached" or "coalesced": true.
+    """
+    conversation_id, question = request.conversation_id, request.question
+    logger.info("Streaming Conversation with ID %s", conversation_id)
+    try:
+        cached, vector = await lookup_answer(conversation_id, question)
+    except Exception as e:
+        logger.error("Error processing conversation %s", e)
+        return {"error": str(e)}
+
+    async def replay(answer: str, flag: str):
+        yield f"data: {json.dumps({'token': answer})}\n\n"
+        yield f"data: {json.dumps({'done': True, flag: True})}\n\n"
+        await save_turn(conversation_id, question, answer)
+
+    async def relay():
+        if cached is not None:
+            async for event in replay(cached, "cached"):
+                yield event
+            return
+        async with in_flight(conversation_id, question) as flight:
+            if flight.coalesced:
+                async for event in replay(flight.result, "coalesced"):
+                    yield event
+                return
+            tokens = []
+            completed = False
+            try:
+                context = await retrieve_docs(conversation_id, question)
+                started = time.perf_counter()
+                async with ai_client.stream(
+                    "POST",
+                    f"/ask_stream/{conversation_id}",
+                    json={
+                        "conversation_id": conversation_id,
+                        "question": question,
+                        "docs": context.text,
+                        "passages": context.passage_texts,
+                        # lets the AI service continue its context only if it saw every turn
+                        "turn": await conversations.count(conversation_id),
+                    },
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[len("data: ") :])
+                        if not tokens:
+                            record_stage("ai_first_token", time.perf_counter() - started)
+                        tokens.append(event.get("token", ""))
+                        completed = completed or bool(event.get("done"))
+                        yield line + "\n\n"
+                # includes the time the client took to read the stream
+                record_stage("ai_stream", time.perf_counter() - started)
+            except Exception as e:
+                logger.error("Error streaming conversation %s", e)
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                return
+            if completed:
+                answer = "".join(tokens)
+                await flight.publish(answer)
+        if completed:
+            await save_turn(conversation_id, question, answer)
+            await store_answer(conversation_id, question, answer, vector)
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/")
@@ -134,48 +487,162 @@ def read_root():
     }
 
 
+class UploadResult(BaseModel):
+    """Outcome of one uploaded file."""
+
+    filename: str
+    collection_id: Optional[str] = None
+    # ingested, queued (see job_id) or error
+    status: str
+    job_id: Optional[str] = None
+    # chunks embedded, unchanged and deleted, for ingested files
+    added: Optional[int] = None
+    skipped: Optional[int] = None
+    removed: Optional[int] = None
+    error: Optional[str] = None
+
+
 class UploadResponse(BaseModel):
     """Response model for uploading files."""
 
     collections: List[str]
+    files: List[UploadResult] = []
 
 
 @app.post("/upload")
-def uploadFiles(files: List[UploadFile] = File(...)) -> UploadResponse:
-    """Upload files to the service."""
+async def uploadFiles(
+    files: List[UploadFile] = File(...), background: bool = False
+) -> UploadResponse:
+    """Upload files to the service.
+
+    Files are forwarded to the retrieval service concurrently, at most
+    UPLOAD_CONCURRENCY at a time, and each gets its own result. With
+    background=true the retrieval service only spools each file and queues an
+    ingestion job; its progress is reported by /jobs/{job_id}.
+    """
+    results = await asyncio.gather(
+        *(upload_file(file, background) for file in files)
+    )
+    return UploadResponse(
+        collections=[r.collection_id for r in results if r.status != "error"],
+        files=results,
+    )
+
+
+async def upload_file(file: UploadFile, background: bool) -> UploadResult:
+    filename = file.filename or ""
+    if not filename.endswith(".txt"):
+        return UploadResult(
+            filename=filename, status="error", error="Only .txt files are allowed"
+        )
+    collection_id = filename or str(uuid4())
+    try:
+        async with upload_slots:
+            logger.info("Uploading file %s", filename)
+            # read off the loop from the spooled upload, at most UPLOAD_CONCURRENCY files
+            # in memory at once, and forwarded as multipart without being decoded here
+            content = await file.read()
+            response = await retrival_client.post(
+                "/upload_document",
+                params={"background": background},
+                files={"file": (collection_id, content, file.content_type or "text/plain")},
+                timeout=httpx.Timeout(UPLOAD_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+        response.raise_for_status()  # Ensure the request succeeded
+        body = response.json()
+        if body.get("error"):
+            raise RuntimeError(body["error"])
+        if background:
+            # the retrieval service clears the cached answers once the job completes
+            return UploadResult(
+                filename=filename,
+                collection_id=body["collection_id"],
+                status="queued",
+                job_id=body["job_id"],
+            )
+        if answer_cache is not None:
+            # answers about the old content are stale
+            await answer_cache.invalidate(collection_id)
+        return UploadResult(
+            filename=filename,
+            collection_id=body["collection_id"],
+            status="ingested",
+            added=body.get("added"),
+            skipped=body.get("skipped"),
+            removed=body.get("removed"),
+        )
+    except Exception as e:
+        logger.error(f"Error uploading file {filename}: {e}")
+        return UploadResult(
+            filename=filename, collection_id=collection_id, status="error", error=str(e)
+        )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the progress of a background ingestion job."""
     try:
-        # Create a new collection
-        collections = []
-        for file in files:
-            if not file.filename.endswith(".txt"):
-                return {"error": "Only .txt files are allowed", collections: []}
-
-            logger.info("Uploading file %s", file.filename)
-            with file.file as file_content:
-                collection_id = file.filename if file.filename else str(uuid4())
-                payload = {
-                    "collection_id": collection_id,
-                    "document_text": file_content.read().decode("utf-8"),
-                }
-                response = requests.post(
-                    f"{RETRIVAL_SERVICE_URL}/save_document/",
-                    json=payload,
-                )
-                response.raise_for_status()  # Ensure the request succeeded
-                collections.append(response.json().get("collection_id"))
-        return UploadResponse(collections=collections)
+        response = await retrival_client.get(f"/jobs/{job_id}")
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Job not found")
+        response.raise_for_status()
+        return response.json()
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error uploading files: {e}")
-        return {"error": str(e), "collections": []}
+        logger.error(f"Error reading job {job_id}: {e}")
+        return {"error": str(e)}
+
+
+async def proxy_listing(request: Request, path: str, params: Optional[dict] = None):
+    """Forward a catalog listing, passing its ETag and a 304 through."""
+    headers = {}
+    if request.headers.get("if-none-match"):
+        headers["If-None-Match"] = request.headers["if-none-match"]
+    response = await retrival_client.get(path, params=params, headers=headers)
+    cache_headers = {
+        name: response.headers[name]
+        for name in ("ETag", "Cache-Control")
+        if name in response.headers
+    }
+    if response.status_code == 304:
+        return Response(status_code=304, headers=cache_headers)
+    if response.status_code == 400:
+        raise HTTPException(status_code=400, detail=response.json().get("detail"))
+    response.raise_for_status()
+    return JSONResponse(content=response.json(), headers=cache_headers)
 
 
 @app.get("/collections")
-def list_collections():
+async def list_collections(request: Request):
     """List all collections."""
     try:
-        response = requests.get(f"{RETRIVAL_SERVICE_URL}/collections/")
-        response.raise_for_status()
-        return response.json()
+        return await proxy_listing(request, "/collections")
     except Exception as e:
         logger.error(f"Error listing collections: {e}")
         return {"error": str(e)}
+
+
+@app.get("/catalog")
+async def get_catalog(
+    request: Request,
+    limit: int = 50,
+    offset: int = 0,
+    search: Optional[str] = None,
+    ingested_after: Optional[float] = None,
+    sort: str = "name",
+    order: str = "asc",
+):
+    """A page of collections with their chunk count, size and last ingest time."""
+    params = {"limit": limit, "offset": offset, "sort": sort, "order": order}
+    if search:
+        params["search"] = search
+    if ingested_after is not None:
+        params["ingested_after"] = ingested_after
+    try:
+        return await proxy_listing(request, "/catalog", params)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reading the catalog: {e}")
+        return {"error": str(e)}
@@ -0,0 +1,167 @@
+"""
+Packing of retrieved chunks into the prompt context.
+
+The retrieval service splits documents with a 200 character overlap, so chunks
+with consecutive chunk_id values repeat text. Packing merges such neighbours
+into one passage without the repeated part, then adds passages in relevance
+order until the token budget is spent, truncating the last one that does not
+fit. Tokens are counted with the generation model's tokenizer (CONTEXT_TOKENIZER,
+a tokenizer.json path or a Hugging Face tokenizer name), so the budget is in the
+tokens of the model that reads the prompt. If it cannot be loaded, a 4 characters
+per token estimate is used; startup logs which of the two counts.
+"""
+
+import logging
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# the splitter's chunk_overlap, the longest repeat worth looking for, and the
+# shortest that is not a coincidence
+MAX_OVERLAP_CHARS = 400
+MIN_OVERLAP_CHARS = 16
+# a truncated passage shorter than this is dropped instead
+MIN_PASSAGE_TOKENS = 32
+SEPARATOR = "\n"
+
+
+class PackedContext(BaseModel):
+    """Context text for the prompt and what packing saved."""
+
+    text: str
+    tokens: int
+    # tokens of the retrieved chunks joined as they are
+    tokens_retrieved: int
+    chunks: int
+    passages: int
+    # the packed passages text was joined from
+    passage_texts: List[str] = []
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_retrieved - self.tokens, 0)
+
+
+class Tokenizer:
+    """Token counting and truncation, with a character estimate as fallback."""
+
+    def __init__(self, name: Optional[str]):
+        self.name = name
+        self._tokenizer = None
+
+    def load(self) -> None:
+        if not self.name:
+            logger.warning("No context tokenizer configured, estimating 4 characters per token")
+            return
+        try:
+            from tokenizers import Tokenizer as HFTokenizer
+
+            if self.name.endswith(".json"):
+                self._tokenizer = HFTokenizer.from_file(self.name)
+            else:
+                self._tokenizer = HFTokenizer.from_pretrained(self.name)
+            logger.info("Counting context tokens with the tokenizer %s", self.name)
+        except Exception as e:
+            logger.warning(
+                "Error loading the context tokenizer %s, estimating 4 characters per token: %s",
+                self.name,
+                e,
+            )
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if tokens <= 0:
+            return ""
+        if self._tokenizer is None:
+            return text[: tokens * 4]
+        offsets = self._tokenizer.encode(text, add_special_tokens=False).offsets
+        if len(offsets) <= tokens:
+            return text
+        return text[: offsets[tokens - 1][1]]
+
+
+def overlap(previous: str, following: str, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of `previous` that starts `following`."""
+    for size in range(min(len(previous), len(following), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+class _Passage:
+    __slots__ = ("source", "first", "last", "text", "rank")
+
+    def __init__(self, source, chunk_id, text: str, rank: int):
+        self.source = source
+        self.first = self.last = chunk_id
+        self.text = text
+        self.rank = rank
+
+
+def merge_chunks(docs: List[dict]) -> List[_Passage]:
+    """Merge chunks with consecutive chunk_ids, dropping their overlapping text.
+
+    `docs` are in relevance order; a passage ranks as its best chunk.
+    """
+    passages: List[_Passage] = []
+    by_position = []
+    for rank, doc in enumerate(docs):
+        metadata = doc.get("metadata") or {}
+        chunk_id = metadata.get("chunk_id")
+        source = metadata.get("source", metadata.get("file"))
+        passage = _Passage(source, chunk_id, doc["page_content"], rank)
+        if isinstance(chunk_id, int):
+            by_position.append(passage)
+        else:
+            passages.append(passage)
+
+    by_position.sort(key=lambda p: (str(p.source), p.first))
+    current = None
+    for passage in by_position:
+        if current is not None and current.source == passage.source:
+            if passage.first == current.last:
+                # the same chunk retrieved twice
+                current.rank = min(current.rank, passage.rank)
+                continue
+            if passage.first == current.last + 1:
+                cut = overlap(current.text, passage.text)
+                joiner = "" if cut else SEPARATOR
+                current.text = current.text + joiner + passage.text[cut:]
+                current.last = passage.first
+                current.rank = min(current.rank, passage.rank)
+                continue
+        current = passage
+        passages.append(current)
+    passages.sort(key=lambda p: p.rank)
+    return passages
+
+
+def pack_context(docs: List[dict], budget: int, tokenizer: Tokenizer) -> PackedContext:
+    """Merge overlapping chunks and fit the most relevant passages into `budget` tokens."""
+    tokens_retrieved = tokenizer.count(SEPARATOR.join(doc["page_content"] for doc in docs))
+    packed, used = [], 0
+    for passage in merge_chunks(docs):
+        tokens = tokenizer.count(passage.text)
+        if budget > 0 and used + tokens > budget:
+            remaining = budget - used
+            if remaining >= MIN_PASSAGE_TOKENS:
+                packed.append(tokenizer.truncate(passage.text, remaining))
+                used = budget
+            break
+        packed.append(passage.text)
+        used += tokens
+    text = SEPARATOR.join(packed)
+    return PackedContext(
+        text=text,
+        tokens=tokenizer.count(text),
+        tokens_retrieved=tokens_retrieved,
+        chunks=len(docs),
+        passages=len(packed),
+        passage_texts=packed,
+    )
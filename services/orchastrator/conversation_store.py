@@ -0,0 +1,101 @@
+"""
+Append-only conversation storage in Redis.
+
+Each conversation is a Redis list of JSON messages plus a counter of every
+message ever appended. A turn is one pipelined RPUSH/LTRIM/INCRBY/EXPIRE, so its
+cost does not grow with the conversation, concurrent turns cannot overwrite
+each other, and history is capped and expires. Messages keep an absolute index
+(from the counter) so clients can fetch only what they have not seen yet.
+"""
+
+import json
+from typing import List, Optional, Tuple
+
+import redis.asyncio as redis
+
+# KEYS: messages list, counter. ARGV: since ("" for none), last ("" for none)
+# Returns the absolute index of the first returned message, the total number of
+# messages ever appended, and the messages.
+READ_SCRIPT = """
+local total = tonumber(redis.call('GET', KEYS[2]) or '0')
+local length = redis.call('LLEN', KEYS[1])
+local first = total - length
+local start = 0
+if ARGV[1] ~= '' then
+    start = math.max(tonumber(ARGV[1]) - first, 0)
+end
+if ARGV[2] ~= '' then
+    start = math.max(start, length - tonumber(ARGV[2]))
+end
+if start >= length then
+    return {first + length, total, {}}
+end
+return {first + start, total, redis.call('LRANGE', KEYS[1], start, -1)}
+"""
+
+
+class ConversationStore:
+    """Stores conversations as capped, expiring Redis lists."""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        ttl_seconds: int = 7 * 24 * 3600,
+        max_messages: int = 200,
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._read = client.register_script(READ_SCRIPT)
+
+    @staticmethod
+    def keys(conversation_id: str) -> Tuple[str, str]:
+        return (
+            f"conversation:{conversation_id}:messages",
+            f"conversation:{conversation_id}:count",
+        )
+
+    async def append(self, conversation_id: str, messages: List[dict]) -> int:
+        """Atomically append messages; returns the new total message count."""
+        messages_key, count_key = self.keys(conversation_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(messages_key, *[json.dumps(message) for message in messages])
+            if self.max_messages > 0:
+                pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.incrby(count_key, len(messages))
+            if self.ttl_seconds > 0:
+                pipe.expire(messages_key, self.ttl_seconds)
+                pipe.expire(count_key, self.ttl_seconds)
+            results = await pipe.execute()
+        return results[2 if self.max_messages > 0 else 1]
+
+    async def count(self, conversation_id: str) -> int:
+        """Number of messages ever appended to a conversation."""
+        return int(await self.client.get(self.keys(conversation_id)[1]) or 0)
+
+    async def read(
+        self,
+        conversation_id: str,
+        since: Optional[int] = None,
+        last: Optional[int] = None,
+    ) -> Tuple[int, int, List[dict]]:
+        """Read messages with absolute index >= since, at most the last `last` of them.
+
+        Returns (index of the first returned message, total count, messages).
+        """
+        first, total, raw = await self._read(
+            keys=list(self.keys(conversation_id)),
+            args=["" if since is None else since, "" if last is None else last],
+        )
+        return int(first), int(total), [json.loads(message) for message in raw]
+
+    async def migrate_legacy(self, conversation_id: str) -> bool:
+        """Move a conversation stored as a single JSON blob to the list layout."""
+        legacy = await self.client.get(conversation_id)
+        if not legacy:
+            return False
+        messages = json.loads(legacy).get("conversation", [])
+        if messages:
+            await self.append(conversation_id, messages)
+        await self.client.delete(conversation_id)
+        return True
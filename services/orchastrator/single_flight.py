@@ -0,0 +1,180 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+Only one generation runs per key at a time across every orchestrator worker.
+Within a process, followers wait on the leader's future. Across processes the
+leader holds a Redis lock (SET NX with a TTL) and, when done, stores the answer
+under a short-lived result key and publishes it on a channel; followers in other
+processes subscribe to the channel. A follower whose leader fails, disappears
+or takes longer than wait_timeout does the work itself.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+COALESCED_REQUESTS = Counter(
+    "orchastrator_coalesced_requests_total",
+    "Requests answered by another request's generation",
+    ["scope"],
+)
+LEADER_REQUESTS = Counter(
+    "orchastrator_singleflight_leaders_total", "Requests that ran the generation"
+)
+FALLBACK_REQUESTS = Counter(
+    "orchastrator_singleflight_fallbacks_total",
+    "Followers that generated themselves after their leader failed or timed out",
+)
+
+# delete the lock only if this process still owns it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class Flight:
+    """One request's view of a flight: the shared answer, or the duty to produce it."""
+
+    def __init__(self, group: "SingleFlight", key: str, result: Optional[str], leader: bool):
+        self.group = group
+        self.key = key
+        # answer produced by another request, None when this request must generate
+        self.result = result
+        self.leader = leader
+        self.answer: Optional[str] = result
+        self.published = False
+
+    @property
+    def coalesced(self) -> bool:
+        return self.result is not None
+
+    async def publish(self, answer: str) -> None:
+        """Hand the answer to every request waiting on this key."""
+        self.answer = answer
+        if self.leader:
+            await self.group._publish(self.key, answer)
+            self.published = True
+
+
+class SingleFlight:
+    """Coalesces identical requests, in process and across processes through Redis."""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        lock_ttl_seconds: int = 300,
+        wait_timeout: float = 300,
+        result_ttl_seconds: int = 30,
+        poll_interval: float = 1.0,
+    ):
+        self.client = client
+        # must outlive the slowest generation, or a second leader may start
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.wait_timeout = wait_timeout
+        # lets followers that subscribe after the publish still find the answer
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+        self._local: Dict[str, asyncio.Future] = {}
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def keys(key: str):
+        return f"inflight:{key}:lock", f"inflight:{key}:result", f"inflight:{key}:done"
+
+    @asynccontextmanager
+    async def flight(self, key: str):
+        local = self._local.get(key)
+        if local is not None:
+            # same process: wait for the local request already handling the key
+            try:
+                result = await asyncio.wait_for(asyncio.shield(local), self.wait_timeout)
+            except Exception:
+                result = None
+            if result is not None:
+                COALESCED_REQUESTS.labels(scope="local").inc()
+            else:
+                FALLBACK_REQUESTS.inc()
+            yield Flight(self, key, result, leader=False)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._local[key] = future
+        lock_key = self.keys(key)[0]
+        token = uuid.uuid4().hex
+        flight = Flight(self, key, None, leader=False)
+        try:
+            try:
+                flight.leader = bool(
+                    await self.client.set(lock_key, token, nx=True, ex=self.lock_ttl_seconds)
+                )
+                if not flight.leader:
+                    flight.result = flight.answer = await self._wait(key)
+                    if flight.result is not None:
+                        COALESCED_REQUESTS.labels(scope="redis").inc()
+                    else:
+                        FALLBACK_REQUESTS.inc()
+            except Exception as e:
+                # coalescing is an optimization, generate normally without redis
+                logger.warning("Error coordinating in-flight request %s", e)
+            if flight.leader:
+                LEADER_REQUESTS.inc()
+            yield flight
+        finally:
+            if not future.done():
+                future.set_result(flight.answer)
+            self._local.pop(key, None)
+            if flight.leader:
+                try:
+                    if not flight.published:
+                        # wake remote followers so they fall back right away
+                        await self._publish(key, None)
+                    await self._release(keys=[lock_key], args=[token])
+                except Exception as e:
+                    logger.warning("Error releasing in-flight request %s", e)
+
+    async def _publish(self, key: str, answer: Optional[str]) -> None:
+        _, result_key, channel = self.keys(key)
+        payload = json.dumps({"answer": answer})
+        async with self.client.pipeline(transaction=True) as pipe:
+            if answer is not None:
+                pipe.set(result_key, payload, ex=self.result_ttl_seconds)
+            pipe.publish(channel, payload)
+            await pipe.execute()
+
+    async def _wait(self, key: str) -> Optional[str]:
+        """Wait for the remote leader's answer; None if it failed or went away."""
+        lock_key, result_key, channel = self.keys(key)
+        deadline = time.monotonic() + self.wait_timeout
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            # the leader may have finished before the subscription started
+            stored = await self.client.get(result_key)
+            if stored is not None:
+                return json.loads(stored)["answer"]
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=min(self.poll_interval, deadline - time.monotonic()),
+                )
+                if message is not None:
+                    return json.loads(message["data"])["answer"]
+                if not await self.client.exists(lock_key):
+                    stored = await self.client.get(result_key)
+                    return json.loads(stored)["answer"] if stored is not None else None
+            return None
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
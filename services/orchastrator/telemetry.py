@@ -0,0 +1,173 @@
+"""
+Request ids and per-stage latency.
+
+Every request gets an id, taken from its X-Request-ID header or generated, that is
+returned with the response and shown in the slow-request log. The orchestrator
+forwards it on its calls to the retrieval and AI services (`propagate_request_id`
+is an httpx request hook), so one question can be followed through every
+service's logs. Hot-path code wraps its stages in `stage(name)`, and durations
+measured elsewhere (e.g. reported by ollama) are added with `record_stage`: each
+stage is observed in <prefix>_stage_seconds and added to the current request's
+breakdown, which is logged for requests slower than SLOW_REQUEST_MS. Stages that
+run outside any request, like ingestion jobs, only feed the histogram.
+
+Every service is its own docker build context, so this module is copied into
+each of them; the copies must stay byte-identical (`python services/check_shared.py`
+compares them). The metric prefix is passed to `configure_metrics` at startup.
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from uuid import uuid4
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# ids longer than this are cut, the header comes from clients
+MAX_REQUEST_ID_LENGTH = 64
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+
+class Metrics:
+    """The telemetry metrics of one service, named <prefix>_..."""
+
+    def __init__(self, prefix: str):
+        self.stage_seconds = Histogram(
+            f"{prefix}_stage_seconds", "Duration of request stages", ["stage"],
+            buckets=LATENCY_BUCKETS,
+        )
+        self.stage_errors = Counter(
+            f"{prefix}_stage_errors_total", "Request stages that raised", ["stage"]
+        )
+        self.request_seconds = Histogram(
+            f"{prefix}_http_request_seconds",
+            "Duration of HTTP requests, until their body is sent",
+            ["method", "route", "status"],
+            buckets=LATENCY_BUCKETS,
+        )
+        self.slow_requests = Counter(
+            f"{prefix}_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ["route"]
+        )
+
+
+# set by configure_metrics; until then (e.g. in a benchmark importing a module
+# directly) stages are only added to the request breakdown
+_metrics: Optional[Metrics] = None
+
+
+def configure_metrics(prefix: str) -> None:
+    """Register the metrics under the service's prefix, once."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(prefix)
+
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Observe a stage timed elsewhere, e.g. a duration reported by an upstream."""
+    if _metrics is not None:
+        _metrics.stage_seconds.labels(stage=name).observe(seconds)
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if _metrics is not None:
+            _metrics.stage_errors.labels(stage=name).inc()
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+async def propagate_request_id(request) -> None:
+    """httpx request hook forwarding the current request id upstream."""
+    request_id = _request_id.get()
+    if request_id and REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = request_id
+
+
+def format_stages(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in stages.items())
+
+
+class TelemetryMiddleware:
+    """ASGI middleware assigning request ids, timing requests and logging slow ones.
+
+    Streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app, slow_request_ms: float = 0, exclude=("/metrics",)):
+        self.app = app
+        self.slow_request_seconds = slow_request_ms / 1000
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = request_id[:MAX_REQUEST_ID_LENGTH] or uuid4().hex
+        stages: Dict[str, float] = {}
+        id_token = _request_id.set(request_id)
+        stages_token = _stages.set(stages)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            # the route template, not the path, keeps the label set bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if _metrics is not None:
+                _metrics.request_seconds.labels(
+                    method=scope["method"], route=route, status=str(status)
+                ).observe(elapsed)
+            if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+                if _metrics is not None:
+                    _metrics.slow_requests.labels(route=route).inc()
+                logger.warning(
+                    "Slow request %s %s %s: %.0fms (%s)",
+                    request_id,
+                    scope["method"],
+                    scope["path"],
+                    elapsed * 1000,
+                    format_stages(stages) or "no stages",
+                )
+            _stages.reset(stages_token)
+            _request_id.reset(id_token)
@@ -0,0 +1,20 @@
+"""
+Redis keys of the orchestrator's answer cache.
+
+The orchestrator reads and writes the cache (answer_cache.py) and the retrieval
+service deletes a collection's keys once its content changes, so both need the
+same names. Every service is its own docker build context, so this module is
+copied into both; the copies must stay byte-identical
+(`python services/check_shared.py` compares them).
+"""
+
+from typing import Tuple
+
+
+def answer_cache_keys(collection: str) -> Tuple[str, str, str]:
+    """The entries hash, vectors hash and LRU zset of a collection's answers."""
+    return (
+        f"answers:{collection}:entries",
+        f"answers:{collection}:vectors",
+        f"answers:{collection}:used",
+    )
@@ -3,23 +3,54 @@ this service is responsible for managing documents
 this service contain two main functions:
 1- save_document: this function is responsible for uploading and update the document into the database
 3- retrieve_document: this function is responsible for retrieving the document from the database
+
+PGVector stores are cached per collection (see store_cache.py) and share a single
+pooled SQLAlchemy engine. Retrieval responses can be projected to a few fields and
+are encoded as JSON or msgpack, compressed when large (see encoding.py).
+Embedding, search, encoding and ingestion stages are timed on /metrics (telemetry.py).
+
+Nothing slow happens at import: the embedding model is loaded in the background
+(model_loader.py) and the database is initialized on first use or by a retrying
+background thread. /healthz reports liveness, /readyz whether both are usable.
+
+/catalog lists collections a page at a time with their chunk counts and sizes
+(catalog.py); listings are cached briefly and revalidated with ETags.
 """
 
 import os
-from typing import List, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_postgres import PGVector
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
 from langchain_core.documents import Document
 
-from fastapi import FastAPI, UploadFile, File
-from sqlalchemy import create_engine, Column, String, JSON, Uuid
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import create_engine, text, Column, String, JSON, Uuid
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import find_dotenv, load_dotenv
 from pydantic import BaseModel
 from uuid import uuid4
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from prometheus_client import make_asgi_app
+from store_cache import StoreCache
+from embedding_batcher import BatchingEmbeddings
+from embedding_cache import CachedQueryEmbeddings
+from ingestion import IngestionJobManager, IngestionJobStatus
+from embedding_pool import EmbeddingWorkerPool, PooledEmbeddings, QUERY_LANE, INGEST_LANE
+from incremental import sync_documents
+from vector_index import ExtensionTooOld, IndexManager, IndexSettings, IndexStatus
+from vector_search import StorageSettings, VectorSearch
+from recall_report import DEFAULT_CONFIGURATIONS, RecallReport, recall_report
+from encoding import documents_content, encode
+from chunking import text_to_documents
+from telemetry import TelemetryMiddleware, configure_metrics, stage
+from model_loader import ModelLoader, backend_kwargs, resolve_model
+from catalog import Catalog, CatalogPage, not_modified
+from answer_keys import answer_cache_keys
+import redis
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,10 +62,79 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_HOST = "database"
 POSTGRES_PORT = POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 
+# connection pool shared by every cached store
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# store cache: how many collections to keep live and for how long (seconds) when idle
+STORE_CACHE_SIZE = int(os.getenv("STORE_CACHE_SIZE", "32"))
+STORE_CACHE_TTL = float(os.getenv("STORE_CACHE_TTL", "600"))
+# query micro-batching: how long to wait for more queries and how many to encode at once
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+# query embedding cache: local LRU, plus a shared redis tier when QUERY_CACHE_REDIS_URL is set
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL")
+QUERY_CACHE_REDIS_TTL = int(os.getenv("QUERY_CACHE_REDIS_TTL", "86400"))
+# the orchestrator's answer cache, dropped for a collection whenever it is re-ingested
+ANSWER_CACHE_REDIS_URL = os.getenv("ANSWER_CACHE_REDIS_URL")
+# background ingestion jobs: chunks per model call, chunks per bulk insert, parallel jobs
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+INGEST_WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", "256"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", tempfile.gettempdir())
+# embedding worker processes (0 keeps the model in the API process)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+EMBED_QUERY_WORKERS = int(os.getenv("EMBED_QUERY_WORKERS", "1"))
+EMBED_WORKER_BATCH_SIZE = int(os.getenv("EMBED_WORKER_BATCH_SIZE", "64"))
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+# ANN index on the embedding table: hnsw, ivfflat or none, and its build parameters
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))
+# search defaults, all can be overridden per request on /retrieve_document
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0")) or None
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0")) or None
+# iterative index scans: auto (relaxed_order on pgvector >= 0.8), off, relaxed_order
+# or strict_order; without them, auto mode scans collections smaller than
+# ANN_MIN_SHARE of the embedding table exactly
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "auto")
+ANN_MIN_SHARE = float(os.getenv("ANN_MIN_SHARE", "0.1"))
+EXACT_SEARCH_THRESHOLD = int(os.getenv("EXACT_SEARCH_THRESHOLD", "10000"))
+# requests slower than this (milliseconds) are logged with their stage breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# embedding model: local snapshot to load instead of the hub (see model_loader.py),
+# runtime (torch, onnx or openvino) and ONNX file, e.g. onnx/model_qint8_avx512_vnni.onnx
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE") or None
+# run the model once before reporting ready, and how long (seconds) requests wait
+# for a model that is still loading
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "true").lower() == "true"
+MODEL_WAIT_TIMEOUT = float(os.getenv("MODEL_WAIT_TIMEOUT", "120"))
+# database initialization retries, backing off from DB_INIT_BACKOFF to DB_INIT_MAX_BACKOFF seconds
+DB_INIT_BACKOFF = float(os.getenv("DB_INIT_BACKOFF", "1"))
+DB_INIT_MAX_BACKOFF = float(os.getenv("DB_INIT_MAX_BACKOFF", "30"))
+# collection listings are cached this long (seconds); ingestion and deletion clear them
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "5"))
+
 
 CONNECTION_STRING = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+# create_engine does not connect, the pool is filled lazily on first use
+engine = create_engine(
+    CONNECTION_STRING,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+
 # setup the FastAPI app
+# stage and request metrics are named retrival_...
+configure_metrics("retrival")
+
 app = FastAPI(
     title="Document Management Service",
     description="This service is responsible for managing documents",
@@ -46,7 +146,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "ETag"],
+)
+app.add_middleware(
+    TelemetryMiddleware,
+    slow_request_ms=SLOW_REQUEST_MS,
+    exclude=("/metrics", "/healthz", "/readyz"),
 )
+app.mount("/metrics", make_asgi_app())
 
 # Define the path to the pre-trained model
 modelPath = "BAAI/bge-small-en-v1.5"
@@ -56,11 +163,163 @@ model_kwargs = {"device": "cpu"}
 # Create a dictionary with encoding options, specifically setting 'normalize_embeddings' to False
 encode_kwargs = {"normalize_embeddings": True}
 
-# Initialize an instance of HuggingFaceEmbeddings with the specified parameters
-embeddings = HuggingFaceEmbeddings(
-    model_name=modelPath,  # Provide the pre-trained model's path
-    model_kwargs=model_kwargs,  # Pass the model configuration options
-    encode_kwargs=encode_kwargs,  # Pass the encoding options
+# identifies the vectors in the shared query cache, other runtimes give slightly different ones
+EMBEDDING_MODEL_ID = (
+    modelPath
+    if EMBEDDING_BACKEND == "torch"
+    else f"{modelPath}:{EMBEDDING_BACKEND}:{EMBEDDING_ONNX_FILE or 'model.onnx'}"
+)
+
+
+def build_models(kwargs: dict):
+    """The (document, query) embedding models; runs on the model loader's thread."""
+    model_name = resolve_model(modelPath, EMBEDDING_MODEL_PATH)
+    if EMBED_WORKERS > 0:
+        # the model runs in worker processes, queries and ingestion get separate lanes
+        embedding_pool = EmbeddingWorkerPool(
+            model_name=model_name,
+            model_kwargs=kwargs,
+            encode_kwargs=encode_kwargs,
+            num_workers=EMBED_WORKERS,
+            query_workers=EMBED_QUERY_WORKERS,
+            dimension=EMBEDDING_DIM,
+            max_batch_size=EMBED_WORKER_BATCH_SIZE,
+        )
+        return (
+            PooledEmbeddings(embedding_pool, lane=INGEST_LANE),
+            PooledEmbeddings(embedding_pool, lane=QUERY_LANE),
+        )
+    # imports torch and sentence-transformers, which alone takes seconds
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=kwargs,
+        encode_kwargs=encode_kwargs,
+    )
+    return model, model
+
+
+def load_models():
+    kwargs = {**model_kwargs, **backend_kwargs(EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE)}
+    try:
+        return build_models(kwargs)
+    except Exception as e:
+        if EMBEDDING_BACKEND == "torch":
+            raise
+        logger.warning(
+            "Error loading the %s runtime, falling back to torch: %s", EMBEDDING_BACKEND, e
+        )
+        return build_models(model_kwargs)
+
+
+model_loader = ModelLoader(load_models, wait_timeout=MODEL_WAIT_TIMEOUT, warmup=EMBED_WARMUP)
+# usable right away, calls wait for the model to be loaded
+embeddings = model_loader.documents
+query_model = model_loader.queries
+
+
+@app.on_event("shutdown")
+def close_embedding_pool():
+    models = model_loader.loaded
+    if models is not None and isinstance(models[0], PooledEmbeddings):
+        models[0].pool.close()
+
+
+# concurrent queries are coalesced into a single forward pass
+query_embeddings = BatchingEmbeddings(
+    query_model,
+    max_batch_size=EMBED_MAX_BATCH_SIZE,
+    max_wait_ms=EMBED_BATCH_WINDOW_MS,
+)
+# repeated questions skip the model entirely
+if QUERY_CACHE_ENABLED:
+    query_embeddings = CachedQueryEmbeddings(
+        query_embeddings,
+        model_name=EMBEDDING_MODEL_ID,
+        max_size=QUERY_CACHE_SIZE,
+        ttl_seconds=QUERY_CACHE_TTL,
+        redis_client=(
+            redis.Redis.from_url(QUERY_CACHE_REDIS_URL)
+            if QUERY_CACHE_REDIS_URL
+            else None
+        ),
+        redis_ttl_seconds=QUERY_CACHE_REDIS_TTL,
+    )
+
+store_cache = StoreCache(
+    engine=engine,
+    embeddings=query_embeddings,
+    embedding_length=EMBEDDING_DIM,
+    max_size=STORE_CACHE_SIZE,
+    ttl_seconds=STORE_CACHE_TTL,
+)
+
+index_manager = IndexManager(
+    engine,
+    dimension=EMBEDDING_DIM,
+    settings=IndexSettings(
+        type=VECTOR_INDEX_TYPE,
+        m=HNSW_M,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        lists=IVFFLAT_LISTS,
+    ),
+)
+
+vector_search = VectorSearch(
+    engine,
+    dimension=EMBEDDING_DIM,
+    exact_threshold=EXACT_SEARCH_THRESHOLD,
+    default_ef_search=HNSW_EF_SEARCH,
+    default_probes=IVFFLAT_PROBES,
+    iterative_scan=VECTOR_ITERATIVE_SCAN,
+    min_ann_share=ANN_MIN_SHARE,
+)
+catalog = Catalog(engine, ttl_seconds=CATALOG_CACHE_TTL)
+
+
+answer_cache_redis = (
+    redis.Redis.from_url(ANSWER_CACHE_REDIS_URL) if ANSWER_CACHE_REDIS_URL else None
+)
+
+
+def invalidate_answer_cache(collection_id: str) -> None:
+    """Drop the orchestrator's cached answers (see orchastrator/answer_cache.py)."""
+    if answer_cache_redis is None:
+        return
+    try:
+        answer_cache_redis.delete(*answer_cache_keys(collection_id))
+    except Exception as e:
+        logger.warning("Error invalidating answer cache: %s", e)
+
+
+def after_ingest(collection_id: str) -> None:
+    """Refresh derived state once a collection's chunks changed."""
+    vector_search.invalidate(collection_id)
+    invalidate_answer_cache(collection_id)
+    try:
+        catalog.record_ingest(collection_id)
+    except Exception as e:
+        logger.warning("Error recording the ingest time: %s", e)
+        catalog.invalidate()
+    # the first ingest creates the embedding table, index it as soon as it exists
+    index_manager.ensure()
+
+
+def collection_store(collection_id: str):
+    """The PGVector store of a collection, once the database is initialized."""
+    ensure_database()
+    return store_cache.get(collection_id).store
+
+
+ingestion_jobs = IngestionJobManager(
+    get_store=collection_store,
+    engine=engine,
+    embeddings=embeddings,
+    on_complete=after_ingest,
+    embed_batch_size=INGEST_EMBED_BATCH_SIZE,
+    write_batch_size=INGEST_WRITE_BATCH_SIZE,
+    max_workers=INGEST_WORKERS,
 )
 
 
@@ -76,6 +335,10 @@ class UpdateCollectionResponse(BaseModel):
 
     document_ids: List[str]
     collection_id: str
+    # chunks embedded, left untouched because unchanged, and deleted because gone
+    added: int = 0
+    skipped: int = 0
+    removed: int = 0
 
 
 @app.get("/")
@@ -87,23 +350,22 @@ def read_root():
 
 
 @app.post("/save_document")
-def save_document(request: UpdateCollectionRequest):
-    """Update a document in the database."""
+def save_document(request: UpdateCollectionRequest, background: bool = False):
+    """Update a document in the database.
+
+    With background=true the document is ingested by a job and its status is returned.
+    """
     collection_id = request.collection_id or str(uuid4())
+    if background:
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=INGEST_SPOOL_DIR, delete=False
+        ) as spool:
+            spool.write(request.document_text)
+        return ingestion_jobs.submit(collection_id, spool.name, {"file": collection_id})
     documents = text_to_documents(request.document_text, {"file": collection_id})
     try:
         logger.info("Updating collection %s", collection_id)
-        store = PGVector(
-            embeddings=embeddings,
-            collection_name=collection_id,
-            connection=CONNECTION_STRING,
-            use_jsonb=True,
-        )
-        retriever = store.as_retriever()
-        documents_id = retriever.add_documents(documents)
-        return UpdateCollectionResponse(
-            document_ids=documents_id, collection_id=collection_id
-        )
+        return index_documents(collection_id, documents)
 
     except Exception as e:
         logger.error(f"Error updating collection: {collection_id}")
@@ -114,11 +376,41 @@ def save_document(request: UpdateCollectionRequest):
         }
 
 
+def index_documents(collection_id: str, documents: List[Document]) -> UpdateCollectionResponse:
+    """Synchronize a collection with the given documents, embedding only new chunks."""
+    store = collection_store(collection_id)
+
+    def embed_chunks(texts: List[str]) -> List[List[float]]:
+        with stage("ingest_embed"):
+            return embeddings.embed_documents(texts)
+
+    # ingest_sync includes ingest_embed
+    with stage("ingest_sync"):
+        result = sync_documents(store, engine, collection_id, documents, embed_chunks)
+    logger.info(
+        "Collection %s: %d chunks added, %d skipped, %d removed",
+        collection_id,
+        result.added,
+        result.skipped,
+        result.removed,
+    )
+    with stage("after_ingest"):
+        after_ingest(collection_id)
+    return UpdateCollectionResponse(collection_id=collection_id, **result.model_dump())
+
+
 class RetriveDocumentRequest(BaseModel):
     """Request model for retrieving a document."""
 
     collection_id: str
     query: str
+    k: int = 4
+    # auto scans small collections exactly and uses the ANN index for large ones
+    mode: str = "auto"
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    # only return these of id, page_content, metadata and score (1 - cosine distance)
+    fields: Optional[List[str]] = None
 
 
 class RetriveDocumentResponse(BaseModel):
@@ -128,18 +420,32 @@ class RetriveDocumentResponse(BaseModel):
 
 
 @app.post("/retrieve_document")
-def retrieve_document(request: RetriveDocumentRequest) -> RetriveDocumentResponse:
-    """Retrieve a document from the database."""
+def retrieve_document(
+    request: RetriveDocumentRequest, http_request: Request
+) -> RetriveDocumentResponse:
+    """Retrieve a document from the database.
+
+    Send Accept: application/msgpack for a msgpack body; documents hold only the
+    requested fields when `fields` is set.
+    """
     try:
         logger.info("Retrieving document %s", request.collection_id)
-        store = PGVector(
-            embeddings=embeddings,
-            collection_name=request.collection_id,
-            connection=CONNECTION_STRING,
-            use_jsonb=True,
-        )
-        retriever = store.as_retriever()
-        return RetriveDocumentResponse(documents=retriever.invoke(input=request.query))
+        ensure_database()
+        with stage("embed_query"):
+            vector = query_embeddings.embed_query(request.query)
+        with stage("vector_search"):
+            results = vector_search.search(
+                request.collection_id,
+                vector,
+                k=request.k,
+                mode=request.mode,
+                ef_search=request.ef_search,
+                probes=request.probes,
+            )
+        with stage("encode"):
+            return encode(
+                http_request, {"documents": documents_content(results, request.fields)}
+            )
     except Exception as e:
         logger.error(f"Error retrieving document: {request.collection_id}")
         logger.debug(f"connection string: {CONNECTION_STRING}")
@@ -149,45 +455,155 @@ def retrieve_document(request: RetriveDocumentRequest) -> RetriveDocumentRespons
         }
 
 
-def text_to_documents(text: str, metadata: dict) -> List[Document]:
-    """Convert text into a list of Document objects."""
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    texts = text_splitter.split_text(text)
-    return [
-        Document(
-            page_content=t,
-            metadata={"chunk_id": idx, "total_chunks": len(texts), **metadata},
-        )
-        for idx, t in enumerate(texts)
-    ]
+class RetrieveBatchItem(BaseModel):
+    """One query of a batched retrieval."""
+
+    collection_id: str
+    query: str
+    k: int = 4
+
+
+class RetrieveBatchRequest(BaseModel):
+    """Request model for retrieving documents for several queries at once."""
+
+    items: List[RetrieveBatchItem]
+    mode: str = "auto"
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    # projection applied to every item's documents, as on /retrieve_document
+    fields: Optional[List[str]] = None
+
+
+class RetrieveBatchResult(BaseModel):
+    """Documents of one batch item, or the error it failed with."""
+
+    collection_id: str
+    query: str
+    documents: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+
+
+class RetrieveBatchResponse(BaseModel):
+    """Response model for batched retrieval, results are in input order."""
+
+    results: List[RetrieveBatchResult]
+
+
+class EmbedRequest(BaseModel):
+    """Request model for embedding queries."""
 
+    texts: List[str]
 
-def parseUploadFile(file_content: bytes) -> List[Document]:
+
+class EmbedResponse(BaseModel):
+    """Query embeddings, in input order."""
+
+    model: str
+    embeddings: List[List[float]]
+
+
+@app.post("/embed")
+def embed(request: EmbedRequest) -> EmbedResponse:
+    """Embed queries with the retrieval model, through the query embedding cache."""
+    try:
+        with stage("embed_query"):
+            vectors = query_embeddings.embed_queries(request.texts)
+        return EmbedResponse(model=modelPath, embeddings=vectors)
+    except Exception as e:
+        logger.error("Error embedding queries")
+        logger.error(e)
+        return {
+            "error": str(e),
+        }
+
+
+@app.post("/retrieve_batch")
+def retrieve_batch(
+    request: RetrieveBatchRequest, http_request: Request
+) -> RetrieveBatchResponse:
+    """Retrieve documents for several (collection, query, k) items in one call.
+
+    All queries are embedded in a single batch and searched with one statement
+    per collection over one pooled connection.
+    """
+    try:
+        logger.info("Retrieving documents for %d queries", len(request.items))
+        ensure_database()
+        with stage("embed_query"):
+            vectors = query_embeddings.embed_queries([item.query for item in request.items])
+        with stage("vector_search"):
+            found = vector_search.search_batch(
+                [
+                    (item.collection_id, vector, item.k)
+                    for item, vector in zip(request.items, vectors)
+                ],
+                mode=request.mode,
+                ef_search=request.ef_search,
+                probes=request.probes,
+            )
+    except Exception as e:
+        logger.error("Error retrieving documents batch")
+        logger.error(e)
+        return {
+            "error": str(e),
+        }
+    results = []
+    for item, result in zip(request.items, found):
+        if isinstance(result, Exception):
+            results.append(
+                RetrieveBatchResult(
+                    collection_id=item.collection_id, query=item.query, error=str(result)
+                )
+            )
+        else:
+            results.append(
+                RetrieveBatchResult(
+                    collection_id=item.collection_id,
+                    query=item.query,
+                    documents=documents_content(result, request.fields),
+                )
+            )
+    with stage("encode"):
+        return encode(http_request, RetrieveBatchResponse(results=results))
+
+
+def parseUploadFile(file_content: bytes, metadata: Optional[dict] = None) -> List[Document]:
     """Parse the content of an uploaded file into a list of Document objects."""
     logger.info("Parsing uploaded file")
     text = file_content.decode("utf-8")
-    return text_to_documents(text, {})
+    return text_to_documents(text, metadata or {})
+
+
+def spool_upload(file: UploadFile) -> str:
+    """Copy an upload to a file in INGEST_SPOOL_DIR for an ingestion job."""
+    with tempfile.NamedTemporaryFile(dir=INGEST_SPOOL_DIR, delete=False) as spool:
+        shutil.copyfileobj(file.file, spool, 1 << 20)
+    return spool.name
+
+
+def ingest_upload(content: bytes, collection_id: str) -> UpdateCollectionResponse:
+    # same chunk metadata as /save_document, so either endpoint can update a collection
+    documents = parseUploadFile(content, {"file": collection_id})
+    logger.info("Uploading document %s", collection_id)
+    return index_documents(collection_id, documents)
 
 
 @app.post("/upload_document")
-async def upload_document(file: UploadFile = File(...)):
-    """Upload a text file and save its content as documents in the database."""
+async def upload_document(file: UploadFile = File(...), background: bool = False):
+    """Upload a text file and save its content as documents in the database.
+
+    With background=true the file is spooled to disk, ingested by a job and the
+    job status is returned right away. Parsing, embedding and writing run on the
+    threadpool, never on the event loop that serves retrieval and the probes.
+    """
     try:
-        content = await file.read()
-        documents = parseUploadFile(content)
         collection_id = file.filename or str(uuid4())
-        logger.info("Uploading document %s", collection_id)
-        store = PGVector(
-            embeddings=embeddings,
-            collection_name=collection_id,
-            connection=CONNECTION_STRING,
-            use_jsonb=True,
-        )
-        retriever = store.as_retriever()
-        documents_id = retriever.add_documents(documents)
-        return UpdateCollectionResponse(
-            document_ids=documents_id, collection_id=collection_id
-        )
+        if background:
+            path = await run_in_threadpool(spool_upload, file)
+            logger.info("Queued ingestion of document %s", collection_id)
+            return ingestion_jobs.submit(collection_id, path, {"file": collection_id})
+        content = await file.read()
+        return await run_in_threadpool(ingest_upload, content, collection_id)
     except Exception as e:
         logger.error("Error uploading document")
         logger.debug(f"connection string: {CONNECTION_STRING}")
@@ -197,6 +613,15 @@ async def upload_document(file: UploadFile = File(...)):
         }
 
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> IngestionJobStatus:
+    """Report the progress of an ingestion job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 # Setup SQLAlchemy
 Base = declarative_base()
 
@@ -211,16 +636,78 @@ class langchain_pg_collection(Base):
         return f"<Collection {self.name}>"
 
 
-try:
-    engine = create_engine(CONNECTION_STRING)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+database_ready = threading.Event()
+database_lock = threading.Lock()
+
+
+def ensure_database() -> None:
+    """Create the tables and the ANN index once; raises while Postgres is unavailable."""
+    if database_ready.is_set():
+        return
+    with database_lock:
+        if database_ready.is_set():
+            return
+        Base.metadata.create_all(bind=engine)
+        try:
+            index_manager.update_extension()
+        except Exception as e:
+            # needs the extension owner; the indexes are checked against what is there
+            logger.warning("Error updating the vector extension: %s", e)
+        index_manager.ensure()
+        database_ready.set()
+        logger.info("Database initialized")
+
+
+def init_database() -> None:
+    """Initialize the database in the background, retrying with backoff until it is up."""
+    delay = DB_INIT_BACKOFF
+    while True:
+        try:
+            ensure_database()
+            return
+        except Exception as e:
+            logger.warning("Database not ready, retrying in %.0fs: %s", delay, e)
+            logger.debug(f"connection string: {CONNECTION_STRING}")
+            time.sleep(delay)
+            delay = min(delay * 2, DB_INIT_MAX_BACKOFF)
+
+
+@app.on_event("startup")
+def start_initialization():
+    model_loader.start()
+    threading.Thread(target=init_database, name="database-init", daemon=True).start()
+
+
+def database_reachable() -> bool:
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.warning("Database unreachable: %s", e)
+        return False
 
-    # Create tables
-    Base.metadata.create_all(bind=engine)
-except Exception as e:
-    logger.error("Error creating tables")
-    logger.debug(f"connection string: {CONNECTION_STRING}")
-    logger.error(e)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process serves requests and the model did not fail to load."""
+    if model_loader.failed:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "model failed to load", "error": str(model_loader.error)},
+        )
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: the model is loaded (and warmed up) and the database answers."""
+    checks = {
+        "model": model_loader.ready,
+        "database": database_ready.is_set() and database_reachable(),
+    }
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **checks})
 
 
 class Collection(BaseModel):
@@ -228,19 +715,23 @@ class Collection(BaseModel):
     name: str
 
 
+def listing_response(http_request: Request, content: Any, tag: str) -> Response:
+    """Encode a catalog listing, or answer 304 when the client already has it."""
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if not_modified(http_request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    response = encode(http_request, content)
+    response.headers.update(headers)
+    return response
+
+
 @app.get("/collections")
-def get_collections() -> List[Collection]:
+def get_collections(http_request: Request) -> List[Collection]:
     try:
         logger.info("Retrieving collections")
-        db = SessionLocal()
-        collections = db.query(langchain_pg_collection).all()
-        return [
-            Collection(
-                id=str(collection.uuid),
-                name=collection.name,
-            )
-            for collection in collections
-        ]
+        ensure_database()
+        collections, tag = catalog.names()
+        return listing_response(http_request, collections, tag)
     except Exception as e:
         logger.error("Error retrieving collections")
         logger.debug(f"connection string: {CONNECTION_STRING}")
@@ -248,5 +739,115 @@ def get_collections() -> List[Collection]:
         return {
             "error": str(e),
         }
+
+
+@app.get("/catalog")
+def get_catalog(
+    http_request: Request,
+    limit: int = 50,
+    offset: int = 0,
+    search: Optional[str] = None,
+    ingested_after: Optional[float] = None,
+    sort: str = "name",
+    order: str = "asc",
+) -> CatalogPage:
+    """A page of collections with their chunk count, size and last ingest time."""
+    try:
+        ensure_database()
+        page, tag = catalog.page(
+            limit=limit,
+            offset=offset,
+            search=search,
+            ingested_after=ingested_after,
+            sort=sort,
+            order=order,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Error reading the catalog")
+        logger.error(e)
+        return {
+            "error": str(e),
+        }
+    return listing_response(http_request, page, tag)
+
+
+@app.delete("/collections/{collection_id}")
+def delete_collection(collection_id: str):
+    """Delete a collection and all of its documents."""
+    try:
+        logger.info("Deleting collection %s", collection_id)
+        collection_store(collection_id).delete_collection()
+        return {"collection_id": collection_id, "deleted": True}
+    except Exception as e:
+        logger.error(f"Error deleting collection: {collection_id}")
+        logger.error(e)
+        return {
+            "error": str(e),
+        }
     finally:
-        db.close()
+        store_cache.invalidate(collection_id)
+        vector_search.invalidate(collection_id)
+        invalidate_answer_cache(collection_id)
+        catalog.invalidate()
+
+
+@app.get("/admin/index")
+def get_index_status() -> IndexStatus:
+    """Report the state and size of the ANN index on the embedding table."""
+    return index_manager.status()
+
+
+@app.post("/admin/index")
+def build_index(settings: IndexSettings, rebuild: bool = True, storage: str = "full"):
+    """Create or rebuild the ANN index (or the halfvec / binary one) in the background."""
+    try:
+        started = index_manager.build(settings, rebuild=rebuild, storage=storage)
+    except ExtensionTooOld as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="An index build is already running")
+    return {"building": True, "storage": storage, "settings": settings}
+
+
+@app.put("/collections/{collection_id}/storage")
+def set_collection_storage(collection_id: str, settings: StorageSettings):
+    """Choose full, halfvec or binary vectors for a collection's first-pass search."""
+    try:
+        # compact storage is refused before it is saved, searches could not serve it
+        index_manager.require(settings.storage)
+        vector_search.set_storage(collection_id, settings)
+        if settings.storage != "full":
+            index_manager.ensure(settings.storage)
+        return {"collection_id": collection_id, **settings.model_dump()}
+    except ExtensionTooOld as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/admin/recall_report")
+def get_recall_report(
+    collection_id: str, samples: int = 50, k: int = 4, ef_search: Optional[int] = None
+) -> RecallReport:
+    """Compare recall and latency of the storage modes on a sample collection."""
+    try:
+        status = index_manager.status()
+        return recall_report(
+            vector_search,
+            collection_id,
+            samples=samples,
+            k=k,
+            ef_search=ef_search,
+            index_bytes={"full": status.index_bytes, **status.compact_index_bytes},
+            configurations=[
+                settings
+                for settings in DEFAULT_CONFIGURATIONS
+                if index_manager.unsupported(storage=settings.storage) is None
+            ],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
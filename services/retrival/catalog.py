@@ -0,0 +1,234 @@
+"""
+Collection catalog: paginated, filterable listing with per-collection stats.
+
+Listing used to load every langchain_pg_collection row through the ORM on each
+call. The catalog selects one page of collections and computes the chunk count
+and sizes of just those with an aggregate over the collection_id index, plus a
+count of the matching collections. Pages are kept in a short TTL cache that
+ingestion and deletion clear, and carry an ETag of their content so clients
+revalidating an unchanged listing get a 304 Not Modified.
+
+The last ingest time is recorded in the collection's cmetadata, where the
+storage settings of vector_search.py also live.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+SORT_COLUMNS = {
+    "name": "c.name",
+    "last_ingested_at": "CAST(CAST(c.cmetadata AS jsonb) ->> 'last_ingested_at' AS double precision)",
+}
+ORDERS = ("asc", "desc")
+MAX_PAGE_SIZE = 1000
+
+FILTER = """
+    WHERE (CAST(:pattern AS text) IS NULL OR c.name ILIKE :pattern ESCAPE '\\')
+      AND (CAST(:ingested_after AS double precision) IS NULL
+           OR CAST(CAST(c.cmetadata AS jsonb) ->> 'last_ingested_at' AS double precision)
+              > :ingested_after)
+"""
+
+COUNT_QUERY = text(f"SELECT count(*) FROM langchain_pg_collection c {FILTER}")
+
+NAMES_QUERY = text("SELECT CAST(c.uuid AS text), c.name FROM langchain_pg_collection c ORDER BY c.name")
+
+# PGVector creates the embedding table with the first store, after the collection table
+EMBEDDING_TABLE_QUERY = text("SELECT to_regclass('langchain_pg_embedding') IS NOT NULL")
+
+NO_STATS = "SELECT 0 AS chunks, 0 AS text_bytes, 0 AS bytes"
+
+EMBEDDING_STATS = """
+            SELECT count(*) AS chunks,
+                   COALESCE(sum(octet_length(e.document)), 0) AS text_bytes,
+                   COALESCE(sum(pg_column_size(e.*)), 0) AS bytes
+            FROM langchain_pg_embedding e
+            WHERE e.collection_id = c.uuid
+"""
+
+RECORD_INGEST_QUERY = text(
+    """
+    UPDATE langchain_pg_collection
+    SET cmetadata = CAST(
+        COALESCE(CAST(cmetadata AS jsonb), '{}'::jsonb)
+        || jsonb_build_object('last_ingested_at', CAST(:ingested_at AS double precision))
+        AS json
+    )
+    WHERE name = :collection
+    """
+)
+
+
+def page_query(sort: str, order: str, stats: bool = True):
+    # the stats of a page are aggregated after it is cut, one index range per collection
+    return text(
+        f"""
+        WITH page AS (
+            SELECT c.uuid, c.name, c.cmetadata
+            FROM langchain_pg_collection c
+            {FILTER}
+            ORDER BY {SORT_COLUMNS[sort]} {order} NULLS LAST, c.name
+            LIMIT :limit OFFSET :offset
+        )
+        SELECT CAST(c.uuid AS text),
+               c.name,
+               s.chunks,
+               s.text_bytes,
+               s.bytes,
+               CAST(CAST(c.cmetadata AS jsonb) ->> 'last_ingested_at' AS double precision)
+        FROM page c
+        LEFT JOIN LATERAL ({EMBEDDING_STATS if stats else NO_STATS}) s ON true
+        ORDER BY {SORT_COLUMNS[sort]} {order} NULLS LAST, c.name
+        """
+    )
+
+
+class CollectionStats(BaseModel):
+    """A collection and the size of its content."""
+
+    id: str
+    name: str
+    chunks: int = 0
+    # UTF-8 size of the chunk texts, and stored size of the rows with their vectors
+    text_bytes: int = 0
+    bytes: int = 0
+    # unix time of the last completed ingestion, unknown for older collections
+    last_ingested_at: Optional[float] = None
+
+
+class CatalogPage(BaseModel):
+    """One page of the catalog and the number of collections matching the filter."""
+
+    collections: List[CollectionStats]
+    total: int
+    limit: int
+    offset: int
+
+
+def like_pattern(search: Optional[str]) -> Optional[str]:
+    """ILIKE pattern matching names that contain `search`."""
+    if not search:
+        return None
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def etag(content) -> str:
+    # weak: the same content is served as JSON or msgpack, compressed or not
+    return 'W/"' + hashlib.sha256(orjson.dumps(content)).hexdigest()[:32] + '"'
+
+
+def not_modified(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether an If-None-Match header already names the current ETag."""
+    if not if_none_match:
+        return False
+    # weak comparison, as If-None-Match requires
+    opaque = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in opaque or tag.removeprefix("W/") in opaque
+
+
+class Catalog:
+    """Cached catalog pages of the PGVector collections."""
+
+    def __init__(self, engine: Engine, ttl_seconds: float = 5, max_entries: int = 256):
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Tuple[object, str, float]]" = OrderedDict()
+        # bumped by invalidate, so a query that raced with it is not cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def page(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        search: Optional[str] = None,
+        ingested_after: Optional[float] = None,
+        sort: str = "name",
+        order: str = "asc",
+    ) -> Tuple[CatalogPage, str]:
+        """A page of the catalog and its ETag."""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort {sort}, expected one of {tuple(SORT_COLUMNS)}")
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order}, expected one of {ORDERS}")
+        if not 0 < limit <= MAX_PAGE_SIZE or offset < 0:
+            raise ValueError(f"limit must be within 1..{MAX_PAGE_SIZE} and offset non-negative")
+        key = ("page", limit, offset, search, ingested_after, sort, order)
+        return self._cached(key, lambda: self._load_page(key))
+
+    def names(self) -> Tuple[List[dict], str]:
+        """Every collection's id and name, for the unpaginated /collections."""
+        return self._cached(("names",), self._load_names)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def record_ingest(self, collection: str, ingested_at: Optional[float] = None) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                RECORD_INGEST_QUERY,
+                {"collection": collection, "ingested_at": ingested_at or time.time()},
+            )
+        self.invalidate()
+
+    def _cached(self, key: tuple, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return entry[0], entry[1]
+            generation = self._generation
+        content = load()
+        tag = etag(content.model_dump() if isinstance(content, BaseModel) else content)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (content, tag, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return content, tag
+
+    def _load_page(self, key: tuple) -> CatalogPage:
+        _, limit, offset, search, ingested_after, sort, order = key
+        params = {"pattern": like_pattern(search), "ingested_after": ingested_after}
+        with self.engine.connect() as conn:
+            total = conn.execute(COUNT_QUERY, params).scalar()
+            # nothing was ingested yet on a fresh database, every collection is empty
+            stats = conn.execute(EMBEDDING_TABLE_QUERY).scalar()
+            rows = conn.execute(
+                page_query(sort, order, stats), {**params, "limit": limit, "offset": offset}
+            ).fetchall()
+        return CatalogPage(
+            collections=[
+                CollectionStats(
+                    id=row[0],
+                    name=row[1],
+                    chunks=row[2],
+                    text_bytes=row[3],
+                    bytes=row[4],
+                    last_ingested_at=row[5],
+                )
+                for row in rows
+            ],
+            total=total,
+            limit=limit,
+            offset=offset,
+        )
+
+    def _load_names(self) -> List[dict]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(NAMES_QUERY).fetchall()
+        return [{"id": row[0], "name": row[1]} for row in rows]
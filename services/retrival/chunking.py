@@ -0,0 +1,70 @@
+"""
+Splitting of document text into chunks.
+
+Kept out of app.py so chunking can be used, and benchmarked, without loading the
+embedding model or connecting to the database.
+"""
+
+from typing import Iterable, Iterator, List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from telemetry import stage
+
+CHUNK_SIZE = 1000
+# neighbouring chunks repeat this many characters (the orchestrator's context
+# packing merges them back)
+CHUNK_OVERLAP = 200
+# text is split this many characters at a time, so memory stays bounded for
+# streamed files and a request body and a job cut the same text the same way
+CHUNK_WINDOW = 1 << 20
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+)
+
+
+def iter_chunks(blocks: Iterable[str], window_size: int = CHUNK_WINDOW) -> Iterator[str]:
+    """Split text arriving in blocks of any size into chunks.
+
+    Windows are cut at fixed offsets of the text, never where a block ends, so
+    the chunks only depend on the text. The last chunk of a window may be cut
+    short by its end, so it is split again together with the next window.
+    """
+    carry, pending, start = "", "", 0
+    for block in blocks:
+        pending = pending[start:] + block
+        start = 0
+        while len(pending) - start >= window_size:
+            window = carry + pending[start : start + window_size]
+            start += window_size
+            chunks = text_splitter.split_text(window)
+            if not chunks:
+                carry = ""
+                continue
+            yield from chunks[:-1]
+            # carry the raw tail, with the separators the splitter stripped
+            tail = window.rfind(chunks[-1])
+            carry = window[tail:] if tail >= 0 else chunks[-1]
+    rest = carry + pending[start:]
+    if rest:
+        yield from text_splitter.split_text(rest)
+
+
+def iter_documents(
+    blocks: Iterable[str], metadata: dict, window_size: int = CHUNK_WINDOW
+) -> Iterator[Document]:
+    """Chunks of streamed text as Documents, numbered by their position.
+
+    Shared by the request and ingestion job paths so that both store the same
+    chunks with the same metadata and re-ingesting with either skips them.
+    """
+    for idx, chunk in enumerate(iter_chunks(blocks, window_size)):
+        yield Document(page_content=chunk, metadata={"chunk_id": idx, **metadata})
+
+
+def text_to_documents(text: str, metadata: dict) -> List[Document]:
+    """Convert text into a list of Document objects."""
+    with stage("split"):
+        return list(iter_documents([text], metadata))
@@ -0,0 +1,113 @@
+"""
+Micro-batching in front of the embedding model.
+
+Every /retrieve_document call embeds a single query. Under concurrency this means
+many batch-of-one forward passes fighting over the same torch threads, so queries
+arriving within a short window are collected and encoded with one
+embed_documents call, and each caller gets its own vector back.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+EMBED_QUEUE_DEPTH = Gauge(
+    "retrival_embed_queue_depth", "Queries waiting to be embedded"
+)
+EMBED_QUEUE_DEPTH_AT_BATCH = Histogram(
+    "retrival_embed_queue_depth_at_batch",
+    "Queries still queued when a batch is dispatched",
+    buckets=(0,) + BATCH_BUCKETS,
+)
+EMBED_BATCH_SIZE = Histogram(
+    "retrival_embed_batch_size",
+    "Number of queries encoded per model call",
+    buckets=BATCH_BUCKETS,
+)
+EMBED_QUEUE_WAIT = Histogram(
+    "retrival_embed_queue_wait_seconds",
+    "Time a query waits before its batch is dispatched",
+)
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces concurrent embed_query calls.
+
+    embed_documents is passed straight through, ingestion already sends batches.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[tuple[str, Future, float]]" = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed a ready-made batch of queries, there is nothing to coalesce."""
+        EMBED_BATCH_SIZE.observe(len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        EMBED_QUEUE_DEPTH.inc()
+        return future.result()
+
+    def _next_batch(self) -> list:
+        """Block for the first query, then gather more until the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # window closed, but still take whatever is already queued
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            dispatched = time.monotonic()
+            EMBED_QUEUE_DEPTH.dec(len(batch))
+            EMBED_QUEUE_DEPTH_AT_BATCH.observe(self._queue.qsize())
+            EMBED_BATCH_SIZE.observe(len(batch))
+            for _, _, enqueued in batch:
+                EMBED_QUEUE_WAIT.observe(dispatched - enqueued)
+
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _, _ in batch])
+            except Exception as e:
+                logger.error("Error embedding batch of %d queries", len(batch))
+                logger.error(e)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
@@ -0,0 +1,175 @@
+"""
+Query-embedding cache for the retrieval service.
+
+Users keep asking the same questions, so query vectors are cached by model name
+and normalized query text. Lookups go to an in-process LRU first and then to an
+optional shared Redis tier so every retrieval replica benefits. Vectors are
+stored as raw float32 bytes rather than JSON.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_HITS = Counter(
+    "retrival_query_cache_hits_total", "Query embedding cache hits", ["tier"]
+)
+QUERY_CACHE_MISSES = Counter(
+    "retrival_query_cache_misses_total", "Query embedding cache misses"
+)
+QUERY_CACHE_ERRORS = Counter(
+    "retrival_query_cache_redis_errors_total", "Failed Redis cache operations"
+)
+QUERY_CACHE_SIZE = Gauge(
+    "retrival_query_cache_size", "Query embeddings held in the local LRU"
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def vector_to_bytes(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def bytes_to_vector(data: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper caching embed_query results in an LRU and Redis."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_size: int = 10000,
+        ttl_seconds: float = 3600,
+        redis_client=None,
+        redis_ttl_seconds: int = 86400,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self._entries: "OrderedDict[str, tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"qemb:{self.model_name}:{digest}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return bytes_to_vector(cached)
+
+        vector = self.embeddings.embed_query(text)
+        data = vector_to_bytes(vector)
+        self._set_local(key, data)
+        self._set_redis(key, data)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, encoding all cache misses in a single batch."""
+        vectors: List[Optional[List[float]]] = []
+        missing = []
+        for text in texts:
+            key = self.cache_key(text)
+            cached = self._lookup(key)
+            if cached is None:
+                missing.append((len(vectors), key, text))
+                vectors.append(None)
+            else:
+                vectors.append(bytes_to_vector(cached))
+
+        if missing:
+            embed = getattr(self.embeddings, "embed_queries", self.embeddings.embed_documents)
+            for (position, key, _), vector in zip(
+                missing, embed([text for _, _, text in missing])
+            ):
+                data = vector_to_bytes(vector)
+                self._set_local(key, data)
+                self._set_redis(key, data)
+                vectors[position] = vector
+        return vectors
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        """Look a key up in the local tier, then in redis, counting hits and misses."""
+        cached = self._get_local(key)
+        if cached is not None:
+            QUERY_CACHE_HITS.labels(tier="local").inc()
+            return cached
+        cached = self._get_redis(key)
+        if cached is not None:
+            QUERY_CACHE_HITS.labels(tier="redis").inc()
+            self._set_local(key, cached)
+            return cached
+        QUERY_CACHE_MISSES.inc()
+        return None
+
+    def _get_local(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, stored_at = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                QUERY_CACHE_SIZE.set(len(self._entries))
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _set_local(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (data, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            QUERY_CACHE_SIZE.set(len(self._entries))
+
+    def _get_redis(self, key: str) -> Optional[bytes]:
+        if self.redis is None:
+            return None
+        try:
+            return self.redis.get(key)
+        except Exception as e:
+            # the shared tier is best effort, fall back to the model
+            QUERY_CACHE_ERRORS.inc()
+            logger.warning("Error reading query cache from redis: %s", e)
+            return None
+
+    def _set_redis(self, key: str, data: bytes) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(key, data, ex=self.redis_ttl_seconds)
+        except Exception as e:
+            QUERY_CACHE_ERRORS.inc()
+            logger.warning("Error writing query cache to redis: %s", e)
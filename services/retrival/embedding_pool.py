@@ -0,0 +1,298 @@
+"""
+Pool of embedding worker processes for the retrieval service.
+
+Running the model inside the API process means encoding competes with request
+handling and is capped by one process's torch thread pool. Each worker here
+loads the model once, is pinned to a round-robin share of the cores (at least
+one), and writes its output as float32 into a shared-memory buffer, so only the
+input texts and a row count cross the pipe.
+
+Requests are served from two lanes: interactive queries are always taken
+first, and a number of workers can be reserved for queries only so heavy
+ingestion never stalls them.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+QUERY_LANE = "query"
+INGEST_LANE = "ingest"
+
+POOL_PENDING = Gauge(
+    "retrival_embed_pool_pending", "Embedding requests waiting for a worker", ["lane"]
+)
+POOL_LATENCY = Histogram(
+    "retrival_embed_pool_seconds",
+    "Time spent encoding a request in a worker process",
+    ["lane"],
+)
+
+
+def _worker_main(
+    conn,
+    shm_name: str,
+    max_batch_size: int,
+    dimension: int,
+    cores: Sequence[int],
+    model_name: str,
+    model_kwargs: dict,
+    encode_kwargs: dict,
+) -> None:
+    """Entry point of a worker process: load the model once and serve batches."""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(max(1, len(cores) or os.cpu_count() or 1))
+    model = SentenceTransformer(model_name, **model_kwargs)
+    shm = SharedMemory(name=shm_name)
+    output = np.ndarray((max_batch_size, dimension), dtype=np.float32, buffer=shm.buf)
+    conn.send(("ready", model.get_sentence_embedding_dimension()))
+    try:
+        while True:
+            texts = conn.recv()
+            if texts is None:
+                break
+            try:
+                vectors = model.encode(texts, convert_to_numpy=True, **encode_kwargs)
+                output[: len(texts)] = vectors
+                conn.send(("ok", len(texts)))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        del output
+        shm.close()
+
+
+def assign_cores(cores: Sequence[int], index: int, num_workers: int) -> List[int]:
+    """Round-robin share of the cores of one worker, at least one core each."""
+    if not cores:
+        return []
+    assigned = [core for position, core in enumerate(cores) if position % num_workers == index]
+    # more workers than cores: some share a core rather than run unpinned
+    return assigned or [cores[index % len(cores)]]
+
+
+class _Worker:
+    """Parent-side handle of one worker process and its shared buffer."""
+
+    def __init__(self, index: int, cores: Sequence[int], pool: "EmbeddingWorkerPool"):
+        self.index = index
+        self.cores = list(cores)
+        self.pool = pool
+        self.shm = SharedMemory(
+            create=True, size=pool.max_batch_size * pool.dimension * 4
+        )
+        self.output = np.ndarray(
+            (pool.max_batch_size, pool.dimension), dtype=np.float32, buffer=self.shm.buf
+        )
+        self.process = None
+        self.conn = None
+        try:
+            self.start()
+        except BaseException:
+            self._release()
+            raise
+
+    def start(self) -> None:
+        parent_conn, child_conn = self.pool.context.Pipe()
+        self.process = self.pool.context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                self.shm.name,
+                self.pool.max_batch_size,
+                self.pool.dimension,
+                self.cores,
+                self.pool.model_name,
+                self.pool.model_kwargs,
+                self.pool.encode_kwargs,
+            ),
+            name=f"embedding-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        try:
+            status, dimension = self.conn.recv()
+            if dimension != self.pool.dimension:
+                raise ValueError(
+                    f"model dimension {dimension} does not match configured {self.pool.dimension}"
+                )
+        except BaseException:
+            # the process holds a loaded model nothing will use
+            self._terminate()
+            raise
+        logger.info("Embedding worker %d ready on cores %s", self.index, self.cores)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        self.conn.send(texts)
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(result)
+        return self.output[:result].copy()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self._terminate(timeout=5)
+        self._release()
+
+    def _terminate(self, timeout: float = 0) -> None:
+        """Wait up to `timeout` seconds for the process to exit, then kill it."""
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def _release(self) -> None:
+        del self.output
+        self.shm.close()
+        self.shm.unlink()
+
+
+class EmbeddingWorkerPool:
+    """Dispatches embedding requests to a fixed set of worker processes."""
+
+    def __init__(
+        self,
+        model_name: str,
+        model_kwargs: dict,
+        encode_kwargs: dict,
+        num_workers: int = 2,
+        query_workers: int = 1,
+        dimension: int = 384,
+        max_batch_size: int = 64,
+        cores: Optional[Sequence[int]] = None,
+    ):
+        self.model_name = model_name
+        self.model_kwargs = model_kwargs
+        self.encode_kwargs = encode_kwargs
+        self.dimension = dimension
+        self.max_batch_size = max_batch_size
+        # workers below this index only serve queries; keep at least one for ingestion
+        self.query_workers = min(query_workers, num_workers - 1)
+        self.context = multiprocessing.get_context("spawn")
+        self._pending = {QUERY_LANE: deque(), INGEST_LANE: deque()}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        if cores is None:
+            cores = (
+                sorted(os.sched_getaffinity(0))
+                if hasattr(os, "sched_getaffinity")
+                else list(range(os.cpu_count() or 1))
+            )
+        self.workers: List[_Worker] = []
+        try:
+            for index in range(num_workers):
+                self.workers.append(_Worker(index, assign_cores(cores, index, num_workers), self))
+        except BaseException:
+            # shut down the workers already started and free their shared memory
+            for worker in self.workers:
+                worker.stop()
+            raise
+        self._threads = [
+            threading.Thread(
+                target=self._dispatch,
+                args=(worker, worker.index >= self.query_workers),
+                name=f"embedding-dispatch-{worker.index}",
+                daemon=True,
+            )
+            for worker in self.workers
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def embed(self, texts: List[str], lane: str = INGEST_LANE) -> List[List[float]]:
+        """Embed texts on the given lane, splitting them into worker-sized requests."""
+        futures = []
+        with self._cond:
+            for start in range(0, len(texts), self.max_batch_size):
+                future: Future = Future()
+                self._pending[lane].append(
+                    (texts[start : start + self.max_batch_size], future)
+                )
+                futures.append(future)
+            POOL_PENDING.labels(lane=lane).set(len(self._pending[lane]))
+            self._cond.notify_all()
+        vectors: List[List[float]] = []
+        for future in futures:
+            vectors.extend(future.result().tolist())
+        return vectors
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        for worker in self.workers:
+            worker.stop()
+
+    def _take(self, allow_ingest: bool):
+        """Wait for the next request, queries first. Returns None once closed."""
+        with self._cond:
+            while not self._closed:
+                for lane in (QUERY_LANE, INGEST_LANE):
+                    if lane == INGEST_LANE and not allow_ingest:
+                        continue
+                    if self._pending[lane]:
+                        request = self._pending[lane].popleft()
+                        POOL_PENDING.labels(lane=lane).set(len(self._pending[lane]))
+                        return lane, request
+                self._cond.wait()
+            return None
+
+    def _dispatch(self, worker: _Worker, allow_ingest: bool) -> None:
+        while True:
+            item = self._take(allow_ingest)
+            if item is None:
+                return
+            lane, (texts, future) = item
+            try:
+                with POOL_LATENCY.labels(lane=lane).time():
+                    future.set_result(worker.encode(texts))
+            except (EOFError, OSError) as e:
+                logger.error("Embedding worker %d died, restarting it", worker.index)
+                logger.error(e)
+                future.set_exception(e)
+                try:
+                    worker.start()
+                except Exception as e:
+                    # keep dispatching: the next request fails on the dead pipe and retries
+                    logger.error("Error restarting embedding worker %d", worker.index)
+                    logger.error(e)
+            except Exception as e:
+                future.set_exception(e)
+
+
+class PooledEmbeddings(Embeddings):
+    """Embeddings interface over one lane of an EmbeddingWorkerPool."""
+
+    def __init__(self, pool: EmbeddingWorkerPool, lane: str):
+        self.pool = pool
+        self.lane = lane
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.pool.embed(texts, lane=self.lane)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.pool.embed([text], lane=self.lane)[0]
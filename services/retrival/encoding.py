@@ -0,0 +1,100 @@
+"""
+Response encoding for the retrieval endpoints.
+
+Documents are the bulk of the traffic between the retrieval service and the
+orchestrator, so these endpoints skip pydantic's JSON rendering: the body is
+encoded with orjson, or with msgpack when the client sends
+`Accept: application/msgpack`, and compressed with zstd or gzip (whichever the
+client's Accept-Encoding prefers) once it is larger than a few kilobytes.
+"""
+
+import gzip
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+import orjson
+import zstandard
+from fastapi import Request, Response
+from langchain_core.documents import Document
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+# document fields a client can ask for; score is the cosine similarity
+DOCUMENT_FIELDS = ("id", "page_content", "metadata", "score")
+
+# a ZstdCompressor must not be used by two threads at once, and the sync
+# endpoints encode on the threadpool: keep one per thread
+_zstd = threading.local()
+
+
+def project(document: Document, distance: float, fields: List[str]) -> Dict[str, Any]:
+    """Keep only the requested fields of a search result."""
+    projected = {}
+    for field in fields:
+        if field == "score":
+            projected["score"] = 1 - float(distance)
+        elif field in DOCUMENT_FIELDS:
+            projected[field] = getattr(document, field)
+        else:
+            raise ValueError(f"Unknown field {field}, expected some of {DOCUMENT_FIELDS}")
+    return projected
+
+
+def documents_content(results: List[Tuple[Document, float]], fields: Optional[List[str]]):
+    """Full documents by default, projected dicts when fields are given."""
+    if not fields:
+        return [document.model_dump() for document, _ in results]
+    return [project(document, distance, fields) for document, distance in results]
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        offered[name.strip().lower()] = quality
+    # prefer zstd on ties, it is faster at a similar ratio
+    candidates = [
+        (offered[name], name == "zstd", name)
+        for name in ("zstd", "gzip")
+        if offered.get(name, 0) > 0
+    ]
+    return max(candidates)[2] if candidates else None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        if not hasattr(_zstd, "compressor"):
+            _zstd.compressor = zstandard.ZstdCompressor(level=3)
+        return _zstd.compressor.compress(body)
+    return gzip.compress(body, compresslevel=5)
+
+
+def encode(
+    request: Request, content: Any, status_code: int = 200, min_compress_size: int = 4096
+) -> Response:
+    """Render content as msgpack or JSON per Accept, compressed per Accept-Encoding."""
+    if MSGPACK in request.headers.get("accept", ""):
+        media_type, body = MSGPACK, msgpack.packb(content, default=_default)
+    else:
+        media_type, body = JSON, orjson.dumps(content, default=_default)
+    headers: Dict[str, str] = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= min_compress_size:
+        encoding = _accepted_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            body = _compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+def _default(value: Any) -> Any:
+    # pydantic models (Document, response models) and anything else str-able
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
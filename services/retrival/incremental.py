@@ -0,0 +1,137 @@
+"""
+Incremental re-indexing of collections.
+
+Chunk ids are derived from a hash of the collection name and the chunk text, so
+re-ingesting a document only embeds chunks that are new or changed. Unchanged
+chunks are skipped (their metadata is refreshed if e.g. their position moved) and
+chunks that disappeared from the document are deleted.
+"""
+
+import hashlib
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from langchain_core.documents import Document
+from langchain_postgres import PGVector
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+class SyncResult(BaseModel):
+    """Outcome of synchronizing a document with a collection."""
+
+    document_ids: List[str]
+    added: int = 0
+    skipped: int = 0
+    removed: int = 0
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def chunk_document_id(collection_id: str, content: str) -> str:
+    """Stable embedding id of a chunk; ids are unique across collections."""
+    return content_hash(f"{collection_id}\x00{content}")
+
+
+def load_existing_chunks(engine: Engine, collection_id: str) -> Dict[str, Optional[dict]]:
+    """Map every embedding id of a collection to its stored metadata."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT e.id, e.cmetadata
+                FROM langchain_pg_embedding e
+                JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                WHERE c.name = :name
+                """
+            ),
+            {"name": collection_id},
+        )
+        return {row[0]: row[1] for row in rows}
+
+
+def update_chunk_metadata(engine: Engine, metadatas: Dict[str, dict]) -> None:
+    """Refresh the metadata of unchanged chunks, e.g. after they moved."""
+    if not metadatas:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE langchain_pg_embedding
+                SET cmetadata = CAST(:metadata AS jsonb)
+                WHERE id = :id
+                """
+            ),
+            [
+                {"id": id_, "metadata": json.dumps(metadata)}
+                for id_, metadata in metadatas.items()
+            ],
+        )
+
+
+def remove_missing_chunks(
+    store: PGVector, existing: Iterable[str], seen: Set[str]
+) -> int:
+    stale = [id_ for id_ in existing if id_ not in seen]
+    if stale:
+        store.delete(ids=stale)
+    return len(stale)
+
+
+def plan_documents(
+    collection_id: str,
+    documents: List[Document],
+    existing: Dict[str, Optional[dict]],
+    seen: Set[str],
+):
+    """Split documents into the ones to embed and the unchanged ones whose metadata moved.
+
+    Returns (ids of all documents, new documents with their ids, changed metadata);
+    ids are added to `seen` as a side effect.
+    """
+    ids, new, moved = [], [], {}
+    for doc in documents:
+        doc_id = chunk_document_id(collection_id, doc.page_content)
+        ids.append(doc_id)
+        if doc_id in seen:
+            # the same text appears twice in the document, keep one copy
+            continue
+        seen.add(doc_id)
+        if doc_id not in existing:
+            new.append((doc_id, doc))
+        elif existing[doc_id] != doc.metadata:
+            moved[doc_id] = doc.metadata
+    return ids, new, moved
+
+
+def sync_documents(
+    store: PGVector,
+    engine: Engine,
+    collection_id: str,
+    documents: List[Document],
+    embed: Callable[[List[str]], List[List[float]]],
+) -> SyncResult:
+    """Make a collection hold exactly the given documents, embedding only new chunks."""
+    existing = load_existing_chunks(engine, collection_id)
+    seen: Set[str] = set()
+    ids, new, moved = plan_documents(collection_id, documents, existing, seen)
+    if new:
+        texts = [doc.page_content for _, doc in new]
+        store.add_embeddings(
+            texts=texts,
+            embeddings=embed(texts),
+            metadatas=[doc.metadata for _, doc in new],
+            ids=[doc_id for doc_id, _ in new],
+        )
+    update_chunk_metadata(engine, moved)
+    removed = remove_missing_chunks(store, existing, seen)
+    return SyncResult(
+        document_ids=ids,
+        added=len(new),
+        skipped=len(seen) - len(new),
+        removed=removed,
+    )
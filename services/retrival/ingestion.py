@@ -0,0 +1,257 @@
+"""
+Background ingestion jobs for the retrieval service.
+
+Large uploads used to be decoded, split, embedded and inserted inside a single
+HTTP request. In job mode the upload only spools the file and returns a job id;
+a worker then streams the file through the text splitter with bounded memory
+(chunking.iter_documents, which cuts and numbers chunks like the request path), embeds the chunks in fixed-size batches and writes them to PGVector in bulk.
+Like the synchronous path, unchanged chunks are skipped and chunks missing from
+the new file are removed (see incremental.py).
+Progress and errors are reported by the /jobs/{job_id} endpoint, and the time
+spent in each step feeds the ingest_* stages of retrival_stage_seconds.
+"""
+
+import codecs
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set
+from uuid import uuid4
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_postgres import PGVector
+from prometheus_client import Counter, Gauge
+from pydantic import BaseModel
+from sqlalchemy.engine import Engine
+
+from chunking import iter_documents
+from incremental import (
+    load_existing_chunks,
+    plan_documents,
+    remove_missing_chunks,
+    update_chunk_metadata,
+)
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOBS = Counter(
+    "retrival_ingest_jobs_total", "Ingestion jobs by final status", ["status"]
+)
+INGEST_CHUNKS = Counter(
+    "retrival_ingest_chunks_total", "Chunks embedded and written by ingestion jobs"
+)
+INGEST_JOBS_RUNNING = Gauge(
+    "retrival_ingest_jobs_running", "Ingestion jobs currently running"
+)
+
+
+class IngestionJobStatus(BaseModel):
+    """Progress report of an ingestion job."""
+
+    job_id: str
+    collection_id: str
+    status: str  # queued, running, completed, failed
+    bytes_read: int = 0
+    bytes_total: Optional[int] = None
+    chunks_split: int = 0
+    chunks_done: int = 0
+    chunks_skipped: int = 0
+    chunks_removed: int = 0
+    # only known once the whole file has been split
+    chunks_total: Optional[int] = None
+    chunks_per_second: float = 0.0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+def iter_text_blocks(
+    stream: BinaryIO, block_size: int, on_read: Callable[[int], None]
+) -> Iterator[str]:
+    """Decode a binary stream as utf-8, one block at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        raw = stream.read(block_size)
+        if not raw:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        on_read(len(raw))
+        text = decoder.decode(raw)
+        if text:
+            yield text
+
+
+class IngestionJobManager:
+    """Runs ingestion jobs on a small worker pool and keeps their status."""
+
+    def __init__(
+        self,
+        get_store: Callable[[str], PGVector],
+        engine: Engine,
+        embeddings: Embeddings,
+        on_complete: Optional[Callable[[str], None]] = None,
+        embed_batch_size: int = 64,
+        write_batch_size: int = 256,
+        read_block_size: int = 1 << 20,
+        max_workers: int = 1,
+        max_history: int = 1000,
+    ):
+        self.get_store = get_store
+        self.engine = engine
+        self.on_complete = on_complete
+        self.embeddings = embeddings
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = max(write_batch_size, embed_batch_size)
+        self.read_block_size = read_block_size
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingestion"
+        )
+        self._jobs: "OrderedDict[str, IngestionJobStatus]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[IngestionJobStatus]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def submit(
+        self,
+        collection_id: str,
+        path: str,
+        metadata: Optional[dict] = None,
+        delete_when_done: bool = True,
+    ) -> IngestionJobStatus:
+        """Queue the ingestion of a utf-8 text file into a collection."""
+        job = IngestionJobStatus(
+            job_id=str(uuid4()),
+            collection_id=collection_id,
+            status="queued",
+            bytes_total=os.path.getsize(path),
+            created_at=time.time(),
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._forget_old_jobs()
+        self._executor.submit(
+            self._run, job, path, metadata or {}, delete_when_done
+        )
+        return job.model_copy()
+
+    def _forget_old_jobs(self) -> None:
+        """Drop the oldest finished jobs beyond max_history. Caller holds the lock."""
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        for job_id in finished[: max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _update(self, job: IngestionJobStatus, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if job.started_at and job.chunks_done:
+                elapsed = (job.finished_at or time.time()) - job.started_at
+                job.chunks_per_second = job.chunks_done / max(elapsed, 1e-6)
+
+    def _run(
+        self, job: IngestionJobStatus, path: str, metadata: dict, delete_when_done: bool
+    ) -> None:
+        INGEST_JOBS_RUNNING.inc()
+        self._update(job, status="running", started_at=time.time())
+        try:
+            logger.info("Ingesting %s into collection %s", path, job.collection_id)
+            store = self.get_store(job.collection_id)
+            with open(path, "rb") as stream:
+                self._ingest(job, store, stream, metadata)
+            self._update(job, status="completed", finished_at=time.time())
+            INGEST_JOBS.labels(status="completed").inc()
+            if self.on_complete is not None:
+                self.on_complete(job.collection_id)
+        except Exception as e:
+            logger.error("Error in ingestion job %s", job.job_id)
+            logger.error(e)
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+            INGEST_JOBS.labels(status="failed").inc()
+        finally:
+            INGEST_JOBS_RUNNING.dec()
+            if delete_when_done:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _ingest(
+        self, job: IngestionJobStatus, store: PGVector, stream: BinaryIO, metadata: dict
+    ) -> None:
+        blocks = iter_text_blocks(
+            stream,
+            self.read_block_size,
+            lambda n: self._update(job, bytes_read=job.bytes_read + n),
+        )
+        with stage("ingest_load_existing"):
+            existing = load_existing_chunks(self.engine, job.collection_id)
+        seen: Set[str] = set()
+        pending: List[Document] = []
+        chunk_id = 0
+        for document in iter_documents(blocks, metadata):
+            pending.append(document)
+            chunk_id += 1
+            self._update(job, chunks_split=chunk_id)
+            if len(pending) >= self.write_batch_size:
+                self._write(job, store, pending, existing, seen)
+                pending = []
+        self._update(job, chunks_total=chunk_id)
+        if pending:
+            self._write(job, store, pending, existing, seen)
+        with stage("ingest_remove"):
+            removed = remove_missing_chunks(store, existing, seen)
+        self._update(job, chunks_removed=removed)
+
+    def _write(
+        self,
+        job: IngestionJobStatus,
+        store: PGVector,
+        batch: List[Document],
+        existing: Dict[str, Optional[dict]],
+        seen: Set[str],
+    ) -> None:
+        """Embed the new chunks of a write batch in sub-batches and insert them in bulk."""
+        with stage("ingest_plan"):
+            _, new, changed = plan_documents(job.collection_id, batch, existing, seen)
+            update_chunk_metadata(self.engine, changed)
+        skipped = len(batch) - len(new)
+        documents = [doc for _, doc in new]
+        texts = [doc.page_content for doc in documents]
+        vectors: List[List[float]] = []
+        with stage("ingest_embed"):
+            for start in range(0, len(texts), self.embed_batch_size):
+                vectors.extend(
+                    self.embeddings.embed_documents(
+                        texts[start : start + self.embed_batch_size]
+                    )
+                )
+        if documents:
+            with stage("ingest_write"):
+                store.add_embeddings(
+                    texts=texts,
+                    embeddings=vectors,
+                    metadatas=[doc.metadata for doc in documents],
+                    ids=[doc_id for doc_id, _ in new],
+                )
+        INGEST_CHUNKS.inc(len(documents))
+        self._update(
+            job,
+            chunks_done=job.chunks_done + len(batch),
+            chunks_skipped=job.chunks_skipped + skipped,
+        )
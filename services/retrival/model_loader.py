@@ -0,0 +1,163 @@
+"""
+Deferred loading of the embedding model.
+
+Building the model (importing torch and sentence-transformers, reading the
+weights) used to happen when app.py was imported, so the service only started
+listening once it was done. ModelLoader builds it on a background thread
+instead: the API is up immediately, embedding calls made before the model is
+loaded wait for it, and /readyz only reports ready once it can embed. An
+optional warm-up pass runs the model once before that, so the first real
+request does not pay for lazy initialization.
+
+The model is read from a local snapshot when EMBEDDING_MODEL_PATH exists; bake
+one into the image with `python model_loader.py <model> <dir>`. The ONNX runtime
+(EMBEDDING_BACKEND=onnx, optionally with a quantized EMBEDDING_ONNX_FILE) needs
+optimum[onnxruntime]; when it cannot be loaded the model falls back to torch.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+MODEL_READY = Gauge("retrival_model_ready", "1 once the embedding model is loaded")
+MODEL_LOAD_SECONDS = Gauge(
+    "retrival_model_load_seconds", "Time taken to load (and warm up) the embedding model"
+)
+
+WARMUP_TEXTS = [
+    "What is this document about?",
+    "A short paragraph of text, about as long as a typical chunk of a document. " * 8,
+]
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+def resolve_model(name: str, local_path: Optional[str]) -> str:
+    """The local snapshot when there is one, the hub model name otherwise."""
+    if local_path and os.path.isfile(os.path.join(local_path, "config.json")):
+        return local_path
+    if local_path:
+        logger.warning("No model snapshot in %s, loading %s from the hub", local_path, name)
+    return name
+
+
+def backend_kwargs(backend: str, onnx_file: Optional[str] = None) -> dict:
+    """sentence-transformers arguments selecting the inference runtime."""
+    if backend == "torch":
+        return {}
+    kwargs = {"backend": backend}
+    if onnx_file:
+        kwargs["model_kwargs"] = {"file_name": onnx_file}
+    return kwargs
+
+
+class ModelLoader:
+    """Builds the (document, query) embedding models in the background.
+
+    `documents` and `queries` can be used right away, they wait for the model.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Tuple[Embeddings, Embeddings]],
+        wait_timeout: float = 120,
+        warmup: bool = True,
+    ):
+        self.factory = factory
+        self.wait_timeout = wait_timeout
+        self.warmup = warmup
+        self.error: Optional[Exception] = None
+        self._models: Optional[Tuple[Embeddings, Embeddings]] = None
+        self._done = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self.documents = LazyEmbeddings(self, 0)
+        self.queries = LazyEmbeddings(self, 1)
+
+    @property
+    def ready(self) -> bool:
+        return self._models is not None
+
+    @property
+    def failed(self) -> bool:
+        return self._done.is_set() and self._models is None
+
+    @property
+    def loaded(self) -> Optional[Tuple[Embeddings, Embeddings]]:
+        return self._models
+
+    def start(self) -> None:
+        """Start loading on a background thread, once."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._load, name="model-loader", daemon=True).start()
+
+    def models(self) -> Tuple[Embeddings, Embeddings]:
+        # a call before startup (e.g. a script importing the app) loads it now
+        self.start()
+        if not self._done.wait(self.wait_timeout):
+            raise ModelNotReady("The embedding model is still loading, retry later")
+        if self._models is None:
+            raise ModelNotReady(f"The embedding model failed to load: {self.error}")
+        return self._models
+
+    def _load(self) -> None:
+        started = time.monotonic()
+        try:
+            models = self.factory()
+            if self.warmup:
+                documents, queries = models
+                documents.embed_documents(WARMUP_TEXTS)
+                queries.embed_query(WARMUP_TEXTS[0])
+            self._models = models
+            elapsed = time.monotonic() - started
+            MODEL_LOAD_SECONDS.set(elapsed)
+            MODEL_READY.set(1)
+            logger.info("Embedding model ready in %.1fs", elapsed)
+        except Exception as e:
+            self.error = e
+            logger.error("Error loading the embedding model")
+            logger.error(e)
+        finally:
+            self._done.set()
+
+
+class LazyEmbeddings(Embeddings):
+    """One of a ModelLoader's models, waiting for it on first use."""
+
+    def __init__(self, loader: ModelLoader, index: int):
+        self.loader = loader
+        self.index = index
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.loader.models()[self.index].embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.loader.models()[self.index].embed_query(text)
+
+
+def download(model: str, target: str, onnx: bool = False) -> None:
+    """Save a snapshot of a hub model for EMBEDDING_MODEL_PATH."""
+    from huggingface_hub import snapshot_download
+
+    patterns = ["*.json", "*.txt", "model.safetensors"]
+    if onnx:
+        patterns.append("onnx/*")
+    snapshot_download(repo_id=model, local_dir=target, allow_patterns=patterns)
+
+
+if __name__ == "__main__":
+    # python model_loader.py BAAI/bge-small-en-v1.5 /models/bge-small-en-v1.5 [--onnx]
+    download(sys.argv[1], sys.argv[2], onnx="--onnx" in sys.argv[3:])
@@ -0,0 +1,118 @@
+"""
+Recall vs latency report for the vector storage modes.
+
+Samples stored chunks of a collection as queries, takes the exact
+full-precision top-k as ground truth and measures recall@k and latency of every
+storage configuration. Sampled chunks always find themselves, so absolute
+recall is slightly optimistic; the comparison between modes is what matters.
+"""
+
+import json
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+
+from vector_search import COLLECTION_FILTER, StorageSettings, VectorSearch
+
+DEFAULT_CONFIGURATIONS = [
+    StorageSettings(storage="full"),
+    StorageSettings(storage="halfvec", rescore_factor=1),
+    StorageSettings(storage="halfvec", rescore_factor=4),
+    StorageSettings(storage="binary", rescore_factor=4),
+    StorageSettings(storage="binary", rescore_factor=10),
+]
+
+
+class RecallReportEntry(BaseModel):
+    """Recall and latency of one storage configuration."""
+
+    storage: str
+    rescore_factor: int
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    index_bytes: int = 0
+
+
+class RecallReport(BaseModel):
+    collection_id: str
+    samples: int
+    k: int
+    exact_p50_ms: float
+    entries: List[RecallReportEntry]
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))]
+
+
+def sample_vectors(search: VectorSearch, collection: str, samples: int) -> List[List[float]]:
+    with search.engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                f"""
+                SELECT CAST(e.embedding AS text) FROM langchain_pg_embedding e
+                WHERE {COLLECTION_FILTER}
+                ORDER BY random()
+                LIMIT :samples
+                """
+            ),
+            {"collection": collection, "samples": samples},
+        ).all()
+    return [json.loads(row[0]) for row in rows]
+
+
+def recall_report(
+    search: VectorSearch,
+    collection: str,
+    samples: int = 50,
+    k: int = 4,
+    ef_search: Optional[int] = None,
+    index_bytes: Optional[Dict[str, int]] = None,
+    configurations: Optional[List[StorageSettings]] = None,
+) -> RecallReport:
+    """Compare storage configurations on a sample of a collection's chunks."""
+    vectors = sample_vectors(search, collection, samples)
+    if not vectors:
+        raise ValueError(f"Collection {collection} has no embeddings")
+
+    truth, exact_latencies = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        found = search.search(collection, vector, k=k, mode="exact")
+        exact_latencies.append((time.perf_counter() - started) * 1000)
+        truth.append({doc.id for doc, _ in found})
+
+    entries = []
+    for settings in configurations or DEFAULT_CONFIGURATIONS:
+        latencies, hits, expected = [], 0, 0
+        for vector, relevant in zip(vectors, truth):
+            started = time.perf_counter()
+            found = search.search(
+                collection, vector, k=k, mode="ann", ef_search=ef_search, storage=settings
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(relevant & {doc.id for doc, _ in found})
+            expected += len(relevant)
+        entries.append(
+            RecallReportEntry(
+                storage=settings.storage,
+                rescore_factor=settings.rescore_factor,
+                recall=hits / expected if expected else 0.0,
+                p50_ms=_percentile(latencies, 0.5),
+                p95_ms=_percentile(latencies, 0.95),
+                index_bytes=(index_bytes or {}).get(settings.storage, 0),
+            )
+        )
+    return RecallReport(
+        collection_id=collection,
+        samples=len(vectors),
+        k=k,
+        exact_p50_ms=_percentile(exact_latencies, 0.5),
+        entries=entries,
+    )
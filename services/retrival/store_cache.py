@@ -0,0 +1,148 @@
+"""
+Cache of live PGVector stores for the retrieval service.
+
+Building a PGVector object runs the extension/table/collection round-trips
+against Postgres, so instead of rebuilding one on every request we keep a
+bounded LRU of ready stores (and their retrievers) keyed by collection name.
+All cached stores share the same pooled SQLAlchemy engine.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_postgres import PGVector
+from prometheus_client import Counter, Gauge
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+STORE_CACHE_HITS = Counter(
+    "retrival_store_cache_hits_total", "PGVector store cache hits"
+)
+STORE_CACHE_MISSES = Counter(
+    "retrival_store_cache_misses_total", "PGVector store cache misses"
+)
+STORE_CACHE_EVICTIONS = Counter(
+    "retrival_store_cache_evictions_total",
+    "PGVector stores dropped from the cache",
+    ["reason"],
+)
+STORE_CACHE_SIZE = Gauge(
+    "retrival_store_cache_size", "Number of PGVector stores currently cached"
+)
+
+
+class CachedStore:
+    """A live PGVector store and its retriever."""
+
+    __slots__ = ("store", "retriever", "last_used")
+
+    def __init__(self, store: PGVector, retriever: VectorStoreRetriever):
+        self.store = store
+        self.retriever = retriever
+        self.last_used = time.monotonic()
+
+
+class StoreCache:
+    """Bounded LRU of PGVector stores with idle-TTL eviction."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        embeddings: Embeddings,
+        embedding_length: Optional[int] = None,
+        max_size: int = 32,
+        ttl_seconds: float = 600,
+    ):
+        self.engine = engine
+        self.embeddings = embeddings
+        # a fixed dimension lets the embedding column carry an ANN index
+        self.embedding_length = embedding_length
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, collection_name: str) -> CachedStore:
+        """Return the cached store for a collection, building it on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(collection_name)
+            if entry is not None:
+                self._entries.move_to_end(collection_name)
+                entry.last_used = now
+                self.hits += 1
+                STORE_CACHE_HITS.inc()
+                return entry
+            self.misses += 1
+            STORE_CACHE_MISSES.inc()
+
+        # Build outside the lock so a slow Postgres does not block hot collections.
+        logger.info("Building store for collection %s", collection_name)
+        store = PGVector(
+            embeddings=self.embeddings,
+            collection_name=collection_name,
+            connection=self.engine,
+            embedding_length=self.embedding_length,
+            use_jsonb=True,
+        )
+        entry = CachedStore(store, store.as_retriever())
+
+        with self._lock:
+            # Another thread may have built the same store in the meantime.
+            existing = self._entries.get(collection_name)
+            if existing is not None:
+                self._entries.move_to_end(collection_name)
+                return existing
+            self._entries[collection_name] = entry
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                STORE_CACHE_EVICTIONS.labels(reason="size").inc()
+                logger.debug("Evicted store for collection %s", evicted)
+            STORE_CACHE_SIZE.set(len(self._entries))
+        return entry
+
+    def invalidate(self, collection_name: str) -> None:
+        """Drop a collection's store, e.g. after it was deleted or recreated."""
+        with self._lock:
+            if self._entries.pop(collection_name, None) is not None:
+                STORE_CACHE_EVICTIONS.labels(reason="invalidated").inc()
+            STORE_CACHE_SIZE.set(len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            STORE_CACHE_SIZE.set(0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict_expired(self, now: float) -> None:
+        """Evict entries idle for longer than the TTL. Caller holds the lock."""
+        if self.ttl_seconds <= 0:
+            return
+        expired = [
+            name
+            for name, entry in self._entries.items()
+            if now - entry.last_used > self.ttl_seconds
+        ]
+        for name in expired:
+            del self._entries[name]
+            STORE_CACHE_EVICTIONS.labels(reason="ttl").inc()
+        if expired:
+            STORE_CACHE_SIZE.set(len(self._entries))
@@ -0,0 +1,368 @@
+"""
+ANN index management for the PGVector embedding table.
+
+langchain_postgres never creates a vector index, so every search is a
+sequential scan over all embeddings. This module creates, rebuilds and reports
+on an HNSW or IVFFlat index over langchain_pg_embedding.embedding (cosine
+distance, which is what PGVector uses by default), plus a btree index on
+collection_id for exact per-collection scans.
+
+Collections can also be searched through compact indexes over half-precision
+(halfvec) or binary-quantized copies of the embeddings. These are expression
+indexes, so the table keeps the full-precision vectors used for rescoring while
+the index that has to fit in shared buffers is 2x (halfvec) or 32x (binary)
+smaller. They need pgvector >= 0.7, and HNSW indexes need pgvector >= 0.5.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_TABLE = "langchain_pg_embedding"
+ANN_INDEX_NAME = "langchain_pg_embedding_embedding_ann_idx"
+COLLECTION_INDEX_NAME = "langchain_pg_embedding_collection_id_idx"
+INDEX_TYPES = ("hnsw", "ivfflat")
+# storage modes of a collection, and the index serving each one
+STORAGE_MODES = ("full", "halfvec", "binary")
+INDEX_NAMES = {
+    "full": ANN_INDEX_NAME,
+    "halfvec": "langchain_pg_embedding_embedding_halfvec_idx",
+    "binary": "langchain_pg_embedding_embedding_binary_idx",
+}
+# oldest pgvector release providing each index type and compact storage
+MIN_PGVECTOR = {"hnsw": (0, 5), "halfvec": (0, 7), "binary": (0, 7)}
+
+# whether an index is valid, and whether it is being built right now
+INDEX_STATE_QUERY = text(
+    """
+    SELECT i.indisvalid,
+           EXISTS (
+               SELECT 1 FROM pg_stat_progress_create_index p
+               WHERE p.index_relid = i.indexrelid
+           )
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = :index
+    """
+)
+
+PGVECTOR_VERSION_QUERY = text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+
+
+class ExtensionTooOld(ValueError):
+    """The installed pgvector release lacks an index type or storage mode."""
+
+
+class IndexSettings(BaseModel):
+    """Type and build parameters of the ANN index."""
+
+    type: str = "hnsw"
+    # hnsw
+    m: int = 16
+    ef_construction: int = 64
+    # ivfflat; 0 picks rows / 1000 (sqrt(rows) above a million rows)
+    lists: int = 0
+
+
+class IndexStatus(BaseModel):
+    """State of the embedding table and its indexes."""
+
+    table_exists: bool
+    rows: int = 0
+    table_bytes: int = 0
+    dimension: Optional[int] = None
+    index_type: Optional[str] = None
+    index_definition: Optional[str] = None
+    index_valid: Optional[bool] = None
+    index_bytes: int = 0
+    building: bool = False
+    build_phase: Optional[str] = None
+    build_progress: Optional[float] = None
+    # bytes of the halfvec / binary expression indexes that exist
+    compact_index_bytes: Dict[str, int] = {}
+    last_error: Optional[str] = None
+
+
+def version_tuple(version: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+def compact_expression(storage: str, dimension: int, vector: str = "embedding") -> str:
+    """SQL expression of the compact copy of a vector, matching the index expression."""
+    dimension = int(dimension)
+    if storage == "halfvec":
+        return f"CAST({vector} AS halfvec({dimension}))"
+    if storage == "binary":
+        return f"CAST(binary_quantize({vector}) AS bit({dimension}))"
+    raise ValueError(f"Unknown compact storage {storage}")
+
+
+class IndexManager:
+    """Creates and rebuilds the ANN index, one build at a time."""
+
+    def __init__(self, engine: Engine, dimension: int, settings: IndexSettings):
+        self.engine = engine
+        self.dimension = dimension
+        self.settings = settings
+        self.last_error: Optional[str] = None
+        self._build_lock = threading.Lock()
+        self._ensured = set()
+        self._version: Optional[str] = None
+
+    def _autocommit(self):
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        return self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+    def table_exists(self, conn) -> bool:
+        return conn.execute(
+            text("SELECT to_regclass(:table) IS NOT NULL"), {"table": EMBEDDING_TABLE}
+        ).scalar()
+
+    def column_dimension(self, conn) -> Optional[int]:
+        typmod = conn.execute(
+            text(
+                """
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding'
+                """
+            ),
+            {"table": EMBEDDING_TABLE},
+        ).scalar()
+        return typmod if typmod and typmod > 0 else None
+
+    def update_extension(self) -> None:
+        """Bring the vector extension of an existing database up to the installed release."""
+        with self.engine.begin() as conn:
+            conn.execute(text("ALTER EXTENSION vector UPDATE"))
+            self._version = conn.execute(PGVECTOR_VERSION_QUERY).scalar() or ""
+        logger.info("pgvector %s", self._version)
+
+    def pgvector_version(self) -> str:
+        """Version of the vector extension, read once."""
+        if self._version is None:
+            with self.engine.connect() as conn:
+                self._version = conn.execute(PGVECTOR_VERSION_QUERY).scalar() or ""
+        return self._version
+
+    def unsupported(
+        self, settings: Optional[IndexSettings] = None, storage: str = "full"
+    ) -> Optional[str]:
+        """Why the database lacks the index type of `settings` or the storage, if it does."""
+        version = self.pgvector_version()
+        features = [(f"{storage} storage", storage)]
+        if settings is not None:
+            features.insert(0, (f"{settings.type} indexes", settings.type))
+        for feature, key in features:
+            required = MIN_PGVECTOR.get(key)
+            if required and version_tuple(version) < required:
+                return (
+                    f"pgvector >= {'.'.join(map(str, required))} is required for {feature}, "
+                    f"the database has {version or 'no vector extension'}"
+                )
+        return None
+
+    def require(self, storage: str) -> None:
+        """Raise ExtensionTooOld unless collections can be searched with this storage."""
+        reason = self.unsupported(storage=storage)
+        if reason:
+            raise ExtensionTooOld(reason)
+
+    def ensure(self, storage: str = "full", background: bool = True) -> None:
+        """Create an index if it is missing. Cheap once it has succeeded."""
+        if storage in self._ensured or self.settings.type not in INDEX_TYPES:
+            return
+        reason = self.unsupported(self.settings, storage)
+        if reason:
+            # reported once rather than failing a build after every ingest
+            logger.error("Not building index %s: %s", INDEX_NAMES[storage], reason)
+            self.last_error = reason
+            self._ensured.add(storage)
+            return
+        with self.engine.connect() as conn:
+            if not self.table_exists(conn):
+                return
+            index = conn.execute(INDEX_STATE_QUERY, {"index": INDEX_NAMES[storage]}).one_or_none()
+        if index is not None and index[0]:
+            self._ensured.add(storage)
+            return
+        if index is not None and index[1]:
+            # a concurrent build, possibly from another replica, is still running
+            return
+        # a failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+        # IF NOT EXISTS would keep and the planner never uses
+        if index is not None:
+            logger.warning("Index %s is invalid, rebuilding it", INDEX_NAMES[storage])
+        self.build(rebuild=index is not None, background=background, storage=storage)
+
+    def build(
+        self,
+        settings: Optional[IndexSettings] = None,
+        rebuild: bool = True,
+        background: bool = True,
+        storage: str = "full",
+    ) -> bool:
+        """Create (or drop and recreate) an ANN index. Returns False if a build is running."""
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage {storage}, expected one of {STORAGE_MODES}")
+        reason = self.unsupported(settings or self.settings, storage)
+        if reason:
+            raise ExtensionTooOld(reason)
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        if settings is not None:
+            self.settings = settings
+        if background:
+            threading.Thread(
+                target=self._build,
+                args=(rebuild, storage),
+                name="index-build",
+                daemon=True,
+            ).start()
+        else:
+            self._build(rebuild, storage)
+        return True
+
+    def _build(self, rebuild: bool, storage: str) -> None:
+        index_name = INDEX_NAMES[storage]
+        try:
+            with self._autocommit() as conn:
+                if not self.table_exists(conn):
+                    raise ValueError("No embeddings have been stored yet")
+                self._fix_dimension(conn)
+                conn.execute(
+                    text(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {COLLECTION_INDEX_NAME} "
+                        f"ON {EMBEDDING_TABLE} (collection_id)"
+                    )
+                )
+                if rebuild:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+                logger.info("Building %s index %s", self.settings.type, index_name)
+                conn.execute(text(self._create_statement(conn, storage)))
+                conn.execute(text(f"ANALYZE {EMBEDDING_TABLE}"))
+            self.last_error = None
+            self._ensured.add(storage)
+            logger.info("Index %s ready", index_name)
+        except Exception as e:
+            logger.error("Error building index %s", index_name)
+            logger.error(e)
+            self.last_error = str(e)
+        finally:
+            self._build_lock.release()
+
+    def _fix_dimension(self, conn) -> None:
+        """Vector indexes need a fixed dimension, which langchain does not set."""
+        if self.column_dimension(conn) is None:
+            logger.info("Setting %s.embedding to vector(%d)", EMBEDDING_TABLE, self.dimension)
+            conn.execute(
+                text(
+                    f"ALTER TABLE {EMBEDDING_TABLE} "
+                    f"ALTER COLUMN embedding TYPE vector({int(self.dimension)})"
+                )
+            )
+
+    def _create_statement(self, conn, storage: str) -> str:
+        settings = self.settings
+        if settings.type == "hnsw":
+            options = f"m = {int(settings.m)}, ef_construction = {int(settings.ef_construction)}"
+        elif settings.type == "ivfflat":
+            lists = settings.lists or self._default_lists(conn)
+            options = f"lists = {int(lists)}"
+        else:
+            raise ValueError(f"Unknown index type {settings.type}")
+        if storage == "full":
+            column = "embedding vector_cosine_ops"
+        elif storage == "halfvec":
+            column = f"({compact_expression(storage, self.dimension)}) halfvec_cosine_ops"
+        else:
+            column = f"({compact_expression(storage, self.dimension)}) bit_hamming_ops"
+        return (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAMES[storage]} "
+            f"ON {EMBEDDING_TABLE} USING {settings.type} ({column}) "
+            f"WITH ({options})"
+        )
+
+    def _default_lists(self, conn) -> int:
+        # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above
+        rows = conn.execute(text(f"SELECT count(*) FROM {EMBEDDING_TABLE}")).scalar()
+        if rows > 1_000_000:
+            return int(rows**0.5)
+        return max(1, rows // 1000)
+
+    def status(self) -> IndexStatus:
+        with self.engine.connect() as conn:
+            if not self.table_exists(conn):
+                return IndexStatus(table_exists=False, last_error=self.last_error)
+            table = conn.execute(
+                text(
+                    """
+                    SELECT c.reltuples::bigint, pg_total_relation_size(c.oid)
+                    FROM pg_class c WHERE c.oid = CAST(:table AS regclass)
+                    """
+                ),
+                {"table": EMBEDDING_TABLE},
+            ).one()
+            index = conn.execute(
+                text(
+                    """
+                    SELECT am.amname, pg_get_indexdef(i.indexrelid), i.indisvalid,
+                           pg_relation_size(i.indexrelid)
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    JOIN pg_am am ON am.oid = c.relam
+                    WHERE c.relname = :index
+                    """
+                ),
+                {"index": ANN_INDEX_NAME},
+            ).one_or_none()
+            progress = conn.execute(
+                text(
+                    """
+                    SELECT p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+                    FROM pg_stat_progress_create_index p
+                    WHERE p.relid = CAST(:table AS regclass)
+                    """
+                ),
+                {"table": EMBEDDING_TABLE},
+            ).one_or_none()
+            compact = conn.execute(
+                text(
+                    """
+                    SELECT relname, pg_relation_size(oid) FROM pg_class
+                    WHERE relname IN (:halfvec, :binary)
+                    """
+                ),
+                {"halfvec": INDEX_NAMES["halfvec"], "binary": INDEX_NAMES["binary"]},
+            ).all()
+            status = IndexStatus(
+                table_exists=True,
+                rows=max(table[0], 0),
+                table_bytes=table[1],
+                dimension=self.column_dimension(conn),
+                compact_index_bytes={
+                    storage: size
+                    for storage in ("halfvec", "binary")
+                    for name, size in compact
+                    if name == INDEX_NAMES[storage]
+                },
+                last_error=self.last_error,
+            )
+        if index is not None:
+            status.index_type, status.index_definition = index[0], index[1]
+            status.index_valid, status.index_bytes = index[2], index[3]
+        if progress is not None:
+            phase, blocks_done, blocks_total, tuples_done, tuples_total = progress
+            status.building, status.build_phase = True, phase
+            if tuples_total:
+                status.build_progress = tuples_done / tuples_total
+            elif blocks_total:
+                status.build_progress = blocks_done / blocks_total
+        else:
+            status.building = self._build_lock.locked()
+        return status
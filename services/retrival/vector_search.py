@@ -0,0 +1,378 @@
+"""
+Vector search over PGVector collections with per-request tuning.
+
+langchain's retriever runs its query on its own session, so there is no way to
+set the ANN search knobs for a single request. Searches here run on the shared
+pooled engine inside a short transaction where hnsw.ef_search / ivfflat.probes
+can be set locally, or where index scans are disabled for an exact search.
+
+Collections configured with compact storage (see vector_index.py) are searched
+in two passes: a shortlist of k * rescore_factor candidates is taken from the
+halfvec or binary index, then rescored against the full-precision vectors.
+
+The ANN index covers every collection and the collection filter is applied to
+what it returns, so a small share of a large table could get fewer than k rows.
+On pgvector >= 0.8 iterative index scans keep scanning until k rows pass the
+filter; on older versions auto mode only uses the index for collections that
+make up a large enough share of the table.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from vector_index import (
+    PGVECTOR_VERSION_QUERY,
+    STORAGE_MODES,
+    compact_expression,
+    version_tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ("auto", "ann", "exact")
+
+COLLECTION_FILTER = """
+    e.collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :collection)
+"""
+
+COLLECTION_INFO_QUERY = text(
+    """
+    SELECT c.cmetadata,
+           (SELECT count(*) FROM langchain_pg_embedding e WHERE e.collection_id = c.uuid),
+           (SELECT reltuples FROM pg_class WHERE oid = to_regclass('langchain_pg_embedding'))
+    FROM langchain_pg_collection c
+    WHERE c.name = :collection
+    """
+)
+
+UPDATE_STORAGE_QUERY = text(
+    """
+    UPDATE langchain_pg_collection
+    SET cmetadata = CAST(
+        COALESCE(CAST(cmetadata AS jsonb), '{}'::jsonb) || CAST(:settings AS jsonb) AS json
+    )
+    WHERE name = :collection
+    """
+)
+
+
+class StorageSettings(BaseModel):
+    """How a collection's vectors are searched."""
+
+    # full, halfvec or binary
+    storage: str = "full"
+    # size of the compact shortlist, as a multiple of k, rescored at full precision
+    rescore_factor: int = 4
+
+
+class CollectionInfo:
+    __slots__ = ("size", "share", "storage", "fetched_at")
+
+    def __init__(self, size: int, share: float, storage: StorageSettings, fetched_at: float):
+        self.size = size
+        # fraction of the embedding table, from the planner's row estimate
+        self.share = share
+        self.storage = storage
+        self.fetched_at = fetched_at
+
+
+def search_sql(
+    storage: str, dimension: int, query: str, k: str, rescore_factor: int = 4
+) -> str:
+    """SELECT id, document, cmetadata, distance of the k nearest chunks.
+
+    `query` and `k` are SQL expressions, so the same statement shape serves
+    single searches (bind parameters) and batches (LATERAL columns).
+    """
+    distance = f"e.embedding <=> {query}"
+    if storage == "full":
+        return f"""
+            SELECT e.id, e.document, e.cmetadata, {distance} AS distance
+            FROM langchain_pg_embedding e
+            WHERE {COLLECTION_FILTER}
+            ORDER BY distance
+            LIMIT {k}
+        """
+    compact_query = compact_expression(storage, dimension, query)
+    operator = "<=>" if storage == "halfvec" else "<~>"
+    return f"""
+        SELECT e.id, e.document, e.cmetadata, {distance} AS distance
+        FROM (
+            SELECT e.id
+            FROM langchain_pg_embedding e
+            WHERE {COLLECTION_FILTER}
+            ORDER BY {compact_expression(storage, dimension, 'e.embedding')} {operator} {compact_query}
+            LIMIT {k} * {int(rescore_factor)}
+        ) candidates
+        JOIN langchain_pg_embedding e ON e.id = candidates.id
+        ORDER BY distance
+        LIMIT {k}
+    """
+
+
+class VectorSearch:
+    """Runs cosine-distance searches with exact / ANN mode selection."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        dimension: int,
+        exact_threshold: int = 10000,
+        default_ef_search: Optional[int] = None,
+        default_probes: Optional[int] = None,
+        iterative_scan: Optional[str] = "auto",
+        min_ann_share: float = 0.1,
+        info_ttl_seconds: float = 60,
+    ):
+        self.engine = engine
+        self.dimension = dimension
+        # collections with fewer chunks than this are scanned exactly in auto mode
+        self.exact_threshold = exact_threshold
+        self.default_ef_search = default_ef_search
+        self.default_probes = default_probes
+        # pgvector >= 0.8: keep scanning the index until k rows pass the collection
+        # filter; auto uses relaxed_order when the extension supports it
+        self.iterative_scan = None if iterative_scan == "off" else iterative_scan
+        # without iterative scans, smaller shares of the table are scanned exactly in auto mode
+        self.min_ann_share = min_ann_share
+        self._resolved_scan: Optional[Tuple[Optional[str]]] = None
+        self.info_ttl_seconds = info_ttl_seconds
+        self._info: Dict[str, CollectionInfo] = {}
+        self._lock = threading.Lock()
+
+    def collection_info(self, collection: str) -> CollectionInfo:
+        """Size and storage settings of a collection, cached for info_ttl_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._info.get(collection)
+            if cached and now - cached.fetched_at < self.info_ttl_seconds:
+                return cached
+        with self.engine.connect() as conn:
+            row = conn.execute(COLLECTION_INFO_QUERY, {"collection": collection}).one_or_none()
+        metadata, size, table_rows = (row[0] or {}, row[1], row[2]) if row else ({}, 0, 0)
+        info = CollectionInfo(
+            size=size,
+            # reltuples is -1 or 0 before the table is first analyzed
+            share=size / table_rows if table_rows and table_rows > 0 else 1.0,
+            storage=StorageSettings(**metadata.get("vector_storage", {})),
+            fetched_at=now,
+        )
+        with self._lock:
+            self._info[collection] = info
+        return info
+
+    def collection_size(self, collection: str) -> int:
+        return self.collection_info(collection).size
+
+    def invalidate(self, collection: str) -> None:
+        with self._lock:
+            self._info.pop(collection, None)
+
+    def set_storage(self, collection: str, settings: StorageSettings) -> None:
+        """Persist a collection's storage settings in its metadata."""
+        if settings.storage not in STORAGE_MODES:
+            raise ValueError(
+                f"Unknown storage {settings.storage}, expected one of {STORAGE_MODES}"
+            )
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                UPDATE_STORAGE_QUERY,
+                {
+                    "collection": collection,
+                    "settings": json.dumps({"vector_storage": settings.model_dump()}),
+                },
+            ).rowcount
+        if not updated:
+            raise ValueError(f"Collection {collection} not found")
+        self.invalidate(collection)
+
+    def iterative_scan_mode(self) -> Optional[str]:
+        """The iterative scan setting, auto resolved once from the pgvector version."""
+        if self.iterative_scan != "auto":
+            return self.iterative_scan
+        if self._resolved_scan is None:
+            try:
+                with self.engine.connect() as conn:
+                    version = conn.execute(PGVECTOR_VERSION_QUERY).scalar() or ""
+            except Exception as e:
+                logger.warning("Error reading the pgvector version: %s", e)
+                return None
+            supported = version_tuple(version) >= (0, 8)
+            self._resolved_scan = ("relaxed_order" if supported else None,)
+            logger.info(
+                "pgvector %s, iterative index scans %s",
+                version,
+                "on" if supported else "unavailable",
+            )
+        return self._resolved_scan[0]
+
+    def plan(self, collection: str, mode: str) -> Tuple[str, StorageSettings]:
+        """Resolve the search mode and the storage used to serve it."""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode}, expected one of {SEARCH_MODES}")
+        info = self.collection_info(collection)
+        if mode == "auto":
+            small = info.size < self.exact_threshold
+            # the filtered index scan could come back with fewer than k rows
+            sparse = info.share < self.min_ann_share and self.iterative_scan_mode() is None
+            mode = "exact" if small or sparse else "ann"
+        # an exact search always compares full-precision vectors
+        storage = StorageSettings() if mode == "exact" else info.storage
+        return mode, storage
+
+    def configure(
+        self,
+        conn,
+        mode: str,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        candidates: int = 0,
+    ) -> None:
+        """Apply the search knobs to the current transaction only."""
+        # always set explicitly, batches reconfigure the same transaction per collection
+        settings = {"enable_indexscan": "off" if mode == "exact" else "on"}
+        if mode != "exact":
+            ef_search = ef_search or self.default_ef_search
+            probes = probes or self.default_probes
+            if candidates and (ef_search or 40) < candidates:
+                # hnsw returns at most ef_search rows, make room for the whole shortlist
+                ef_search = candidates
+            if ef_search:
+                settings["hnsw.ef_search"] = str(int(ef_search))
+            if probes:
+                settings["ivfflat.probes"] = str(int(probes))
+            iterative_scan = self.iterative_scan_mode()
+            if iterative_scan:
+                settings["hnsw.iterative_scan"] = iterative_scan
+                # ivfflat only has relaxed_order
+                settings["ivfflat.iterative_scan"] = "relaxed_order"
+        for name, value in settings.items():
+            conn.execute(
+                text("SELECT set_config(:name, :value, true)"),
+                {"name": name, "value": value},
+            )
+
+    def search(
+        self,
+        collection: str,
+        vector: List[float],
+        k: int = 4,
+        mode: str = "auto",
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        storage: Optional[StorageSettings] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Return the k nearest chunks of a collection with their cosine distance.
+
+        `storage` overrides the collection's configured storage settings.
+        """
+        mode, configured = self.plan(collection, mode)
+        storage = storage or configured
+        sql = search_sql(
+            storage.storage,
+            self.dimension,
+            f"CAST(:query AS vector({int(self.dimension)}))",
+            ":k",
+            storage.rescore_factor,
+        )
+        with self.engine.begin() as conn:
+            self.configure(
+                conn, mode, ef_search, probes, self._candidates(storage, k)
+            )
+            rows = conn.execute(
+                text(sql),
+                {"query": _vector_literal(vector), "collection": collection, "k": k},
+            ).all()
+        # relaxed_order scans may return rows slightly out of order
+        return sorted((_to_result(row) for row in rows), key=lambda result: result[1])
+
+    def search_batch(
+        self,
+        requests: List[Tuple[str, List[float], int]],
+        mode: str = "auto",
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+    ) -> List[Union[List[Tuple[Document, float]], Exception]]:
+        """Search many (collection, vector, k) requests over a single connection.
+
+        Requests are grouped by collection and each group runs as one statement
+        in its own savepoint, so a failing collection only fails its own items.
+        Results come back in input order; failed items hold their exception.
+        """
+        results: List[Union[List[Tuple[Document, float]], Exception]] = [
+            [] for _ in requests
+        ]
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for position, (collection, _, _) in enumerate(requests):
+            groups[collection].append(position)
+
+        with self.engine.begin() as conn:
+            for collection, positions in groups.items():
+                try:
+                    with conn.begin_nested():
+                        group_mode, storage = self.plan(collection, mode)
+                        ks = [requests[p][2] for p in positions]
+                        self.configure(
+                            conn,
+                            group_mode,
+                            ef_search,
+                            probes,
+                            self._candidates(storage, max(ks)),
+                        )
+                        # every query of the batch gets its own LATERAL top-k
+                        inner = search_sql(
+                            storage.storage,
+                            self.dimension,
+                            f"CAST(q.vec AS vector({int(self.dimension)}))",
+                            "q.k",
+                            storage.rescore_factor,
+                        )
+                        rows = conn.execute(
+                            text(
+                                f"""
+                                SELECT q.idx, r.id, r.document, r.cmetadata, r.distance
+                                FROM unnest(CAST(:vectors AS text[]), CAST(:ks AS int[]))
+                                     WITH ORDINALITY AS q(vec, k, idx)
+                                CROSS JOIN LATERAL ({inner}) r
+                                ORDER BY q.idx, r.distance
+                                """
+                            ),
+                            {
+                                "collection": collection,
+                                "vectors": [
+                                    _vector_literal(requests[p][1]) for p in positions
+                                ],
+                                "ks": ks,
+                            },
+                        ).all()
+                except Exception as e:
+                    logger.error("Error searching collection %s", collection)
+                    logger.error(e)
+                    for position in positions:
+                        results[position] = e
+                    continue
+                for row in rows:
+                    # ordinality is 1-based
+                    results[positions[row[0] - 1]].append(_to_result(row[1:]))
+        return results
+
+    @staticmethod
+    def _candidates(storage: StorageSettings, k: int) -> int:
+        return 0 if storage.storage == "full" else k * storage.rescore_factor
+
+
+def _to_result(row) -> Tuple[Document, float]:
+    return Document(id=row[0], page_content=row[1], metadata=row[2] or {}), row[3]
+
+
+def _vector_literal(vector: List[float]) -> str:
+    return "[" + ",".join(map(repr, map(float, vector))) + "]"
@@ -1,10 +1,85 @@
 import streamlit as st
-from typing import List
-import requests
+from typing import Iterator, List
+import json
+import os
 import time
+from uuid import uuid4
+import requests
+from requests.adapters import HTTPAdapter
+from prometheus_client import Counter, Histogram, start_http_server
 
 CHATBOT_URL = "http://app:8000"
 # CHATBOT_URL = "http://localhost:9000/"
+# port of the Prometheus /metrics endpoint (0 disables it)
+UI_METRICS_PORT = int(os.getenv("UI_METRICS_PORT", "9100"))
+# how long (seconds) the collection list is reused before it is fetched again
+UI_COLLECTIONS_TTL = int(os.getenv("UI_COLLECTIONS_TTL", "30"))
+# keep-alive connections to the orchestrator, shared by every session
+UI_HTTP_POOL_SIZE = int(os.getenv("UI_HTTP_POOL_SIZE", "20"))
+
+
+class Metrics:
+    """Latency of the UI's calls to the orchestrator, as users see it."""
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "ui_request_seconds",
+            "Duration of calls to the orchestrator, to the response headers",
+            ["endpoint", "status"],
+        )
+        self.first_token_seconds = Histogram(
+            "ui_first_token_seconds",
+            "Time from sending a question to its first streamed token",
+            buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+        )
+        self.answer_seconds = Histogram(
+            "ui_answer_seconds",
+            "Time from sending a question to the end of its answer",
+            buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+        )
+        self.errors = Counter(
+            "ui_request_errors_total", "Failed calls to the orchestrator", ["endpoint"]
+        )
+
+
+@st.cache_resource
+def metrics() -> Metrics:
+    # streamlit reruns this script for every interaction, register the metrics once
+    if UI_METRICS_PORT:
+        start_http_server(UI_METRICS_PORT)
+    return Metrics()
+
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    # one connection pool for every user and rerun, instead of a connection per call
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UI_HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def call(method: str, endpoint: str, path: str, **kwargs) -> requests.Response:
+    """Call the orchestrator with a fresh X-Request-ID, recording the latency.
+
+    `endpoint` is the metric label, `path` the actual path.
+    """
+    headers = {"X-Request-ID": uuid4().hex, **kwargs.pop("headers", {})}
+    started = time.perf_counter()
+    try:
+        response = http_session().request(
+            method, f"{CHATBOT_URL}{path}", headers=headers, **kwargs
+        )
+    except Exception:
+        metrics().errors.labels(endpoint=endpoint).inc()
+        raise
+    metrics().request_seconds.labels(
+        endpoint=endpoint, status=str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    if response.status_code >= 400:
+        metrics().errors.labels(endpoint=endpoint).inc()
+    return response
 
 
 class Collection:
@@ -13,17 +88,36 @@ class Collection:
         self.id = id
 
 
+@st.cache_resource
+def last_collections() -> dict:
+    # the last listing and its ETag, revalidated once the TTL below expires
+    return {}
+
+
+@st.cache_data(ttl=UI_COLLECTIONS_TTL, show_spinner=False)
+def fetch_collections() -> List[dict]:
+    # shared by every session until the TTL expires or an upload clears it;
+    # errors are raised, so they are not cached
+    last = last_collections()
+    headers = {"If-None-Match": last["etag"]} if "etag" in last else {}
+    response = call("GET", "/collections", "/collections", headers=headers)
+    if response.status_code == 304:
+        return last["body"]
+    response.raise_for_status()
+    body = response.json()
+    if not isinstance(body, list):
+        raise RuntimeError(body.get("error", "unexpected response"))
+    if response.headers.get("ETag"):
+        last.update(etag=response.headers["ETag"], body=body)
+    return body
+
+
 def list_collections() -> List[Collection]:
     try:
-        response = requests.get(f"{CHATBOT_URL}/collections")
-        if response.status_code == 200:
-            collections = [
-                Collection(name=collection["name"], id=collection["id"])
-                for collection in response.json()
-            ]
-        else:
-            collections = []
-        return collections
+        return [
+            Collection(name=collection["name"], id=collection["id"])
+            for collection in fetch_collections()
+        ]
     except Exception as e:
         st.error(f"Error listing collections: {e}")
         return []
@@ -55,17 +149,29 @@ def main():
 
 def upload_files():
     uploaded_files = st.file_uploader(
-        "Upload txt files", type="txt", accept_multiple_files=False
+        "Upload txt files", type="txt", accept_multiple_files=True
     )
-    if uploaded_files:
+    # the uploader keeps its files across reruns, only send the new ones
+    uploaded = st.session_state.setdefault("uploaded_files", set())
+    new_files = [f for f in uploaded_files or [] if f.file_id not in uploaded]
+    if new_files:
+        # the orchestrator uploads them concurrently and reports each file
         files = [
-            ("files", (uploaded_files.name, uploaded_files.getvalue(), "text/plain"))
+            ("files", (uploaded_file.name, uploaded_file.getvalue(), "text/plain"))
+            for uploaded_file in new_files
         ]
         try:
-            response = requests.post(f"{CHATBOT_URL}/upload/", files=files)
+            response = call("POST", "/upload", "/upload", files=files)
             if response.status_code == 200:
+                uploaded.update(f.file_id for f in new_files)
+                fetch_collections.clear()
                 st.session_state.collections = list_collections()
-                st.success("Collections created successfully")
+                results = response.json().get("files", [])
+                failed = [result for result in results if result["status"] == "error"]
+                for result in failed:
+                    st.error(f"{result['filename']}: {result['error']}")
+                if len(failed) < len(results):
+                    st.success("Collections created successfully")
             else:
                 st.error("Failed to create collections")
         except Exception as e:
@@ -81,46 +187,101 @@ def chat_page():
         st.button(
             "Back to collections", on_click=lambda: st.session_state.pop("collection")
         )
-    response = requests.get(
-        f"{CHATBOT_URL}/collectionChat/{st.session_state.collection.name}"
-    )
-    conversation = [
-        message
-        for message in response.json()["conversation"]
-        if message["role"] != "system"
-    ]
-    st.session_state.conversation = conversation
-    if st.session_state.conversation:
+    conversation = load_conversation(st.session_state.collection.name)
+    question = st.session_state.pop("pending_question", None)
+    if conversation or question:
         chat_container = st.container(border=True, height=450)
         with chat_container:
-            for idx, message in enumerate(st.session_state.conversation):
+            # messages already shown are rendered as they are, only a new answer streams
+            for message in conversation:
                 with st.chat_message(message["role"]):
-                    if idx == len(st.session_state.conversation) - 1:
-                        st.write_stream(stream_response(message["content"]))
-                    else:
-                        st.markdown(message["content"])
+                    st.markdown(message["content"])
+            if question:
+                with st.chat_message("user"):
+                    st.markdown(question)
+                with st.chat_message("assistant"):
+                    # the orchestrator saves the turn, the next fetch picks it up
+                    st.write_stream(stream_response(question))
     st.text_input("Ask a question:", key="user_input", on_change=ask)
 
 
-def ask():
-    with st.spinner("Analyzing... Please wait..."):
-        qst = st.session_state.user_input
-        response = requests.post(
-            f"{CHATBOT_URL}/ask/{st.session_state.collection.name}",
-            json={"question": qst, "conversation_id": st.session_state.collection.name},
+def load_conversation(name: str) -> List[dict]:
+    """The conversation kept in the session, topped up with the newer messages.
+
+    Only messages past the last known index are fetched, so a rerun costs one
+    small request however long the chat is.
+    """
+    chat = st.session_state.get("chat")
+    if chat is None or chat["name"] != name:
+        chat = {"name": name, "messages": [], "total": 0, "greeting": []}
+        st.session_state.chat = chat
+    try:
+        response = call(
+            "GET",
+            "/collectionChat/{conversation_id}",
+            f"/collectionChat/{name}",
+            params={"since": chat["total"]},
         )
-        if response.status_code == 200:
-            bot_response = response.json()
-            st.session_state.conversation.append(bot_response)
-            st.session_state.user_input = ""
-        else:
-            st.error("Failed to get response")
-
-
-def stream_response(response):
-    for word in response.split():
-        yield word + " "
-        time.sleep(0.05)
+        response.raise_for_status()
+        body = response.json()
+        if "conversation" not in body:
+            raise RuntimeError(body.get("error", "unexpected response"))
+    except Exception as e:
+        st.error(f"Error loading the conversation: {e}")
+        return chat["messages"] or chat["greeting"]
+    if body["total"] == 0:
+        # an empty conversation comes with a greeting that is not part of it
+        chat["greeting"] = body["conversation"]
+        return chat["greeting"]
+    for offset, message in enumerate(body["conversation"]):
+        if body["start"] + offset >= chat["total"] and message["role"] != "system":
+            chat["messages"].append(message)
+    chat["total"] = max(chat["total"], body["total"])
+    return chat["messages"]
+
+
+def ask():
+    # the answer is streamed into the chat container on the rerun that follows
+    st.session_state.pending_question = st.session_state.user_input
+    st.session_state.user_input = ""
+
+
+def stream_response(question) -> Iterator[str]:
+    """Yield the answer tokens as the orchestrator streams them."""
+    started = time.perf_counter()
+    first_token = True
+    try:
+        with call(
+            "POST",
+            "/ask_stream/{conversation_id}",
+            f"/ask_stream/{st.session_state.collection.name}",
+            json={
+                "question": question,
+                "conversation_id": st.session_state.collection.name,
+            },
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: ") :])
+                if event.get("error"):
+                    metrics().errors.labels(endpoint="/ask_stream/{conversation_id}").inc()
+                    st.error(
+                        "Failed to get response "
+                        f"(request {response.headers.get('X-Request-ID')})"
+                    )
+                    return
+                if event.get("token"):
+                    if first_token:
+                        metrics().first_token_seconds.observe(time.perf_counter() - started)
+                        first_token = False
+                    yield event["token"]
+                if event.get("done"):
+                    metrics().answer_seconds.observe(time.perf_counter() - started)
+    except Exception as e:
+        st.error(f"Failed to get response: {e}")
 
 
 # Routing